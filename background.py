@@ -0,0 +1,49 @@
+import logging
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos (um único worker)
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundLock:
+    """Trava de arquivo que elege o worker responsável pelas tarefas em segundo plano.
+
+    Pré-busca e retenção devem rodar uma vez por servidor, não uma vez por
+    worker. A trava fica com o processo que a obteve até ele encerrar (o sistema
+    a libera mesmo se o worker morrer), e outro worker pode assumir.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self) -> bool:
+        """Tenta obter a trava sem bloquear; True se este processo a detém"""
+        if self._file is not None:
+            return True
+        lock_file = open(self.path, "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return False
+        self._file = lock_file
+        logger.info("Worker %d assumiu as tarefas em segundo plano", os.getpid())
+        return True
+
+    def release(self):
+        lock_file = self._file
+        if lock_file is not None:
+            self._file = None
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
@@ -0,0 +1,94 @@
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    """Percentil pelo método nearest-rank (valores já ordenados)"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values), math.ceil(fraction * len(sorted_values))) - 1)
+    return sorted_values[index]
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/máximo em milissegundos"""
+    values = sorted(latencies)
+    return {
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+def environment() -> Dict[str, str]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(RESULTS_DIR),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = "desconhecido"
+    return {
+        "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count() or 0,
+    }
+
+
+def save_results(name: str, payload: Dict, output: Optional[str] = None) -> str:
+    """Grava os resultados em JSON (por padrão em bench/results/<nome>-<data>.json)"""
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{name}-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(payload, file, indent=2, ensure_ascii=False)
+    return output
+
+
+def find_regressions(results: List[Dict], baseline_path: str, key_fields: Sequence[str],
+                     tolerance: float) -> List[str]:
+    """Compara p95 e vazão com um resultado anterior; devolve as pioras acima de `tolerance`"""
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = {
+            tuple(item[field] for field in key_fields): item for item in json.load(file)["results"]
+        }
+    regressions = []
+    for item in results:
+        key = tuple(item[field] for field in key_fields)
+        before = baseline.get(key)
+        if before is None:
+            continue
+        label = " ".join(f"{field}={value}" for field, value in zip(key_fields, key))
+        if before.get("p95_ms") and item["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {before['p95_ms']}ms -> {item['p95_ms']}ms")
+        rate_field = "throughput_rps" if "throughput_rps" in item else "rows_per_second"
+        if before.get(rate_field) and item.get(rate_field, 0) < before[rate_field] * (1 - tolerance):
+            regressions.append(f"{label}: {rate_field} {before[rate_field]} -> {item[rate_field]}")
+    return regressions
+
+
+def report_regressions(results: List[Dict], baseline_path: Optional[str], key_fields: Sequence[str],
+                       tolerance: float):
+    """Imprime as regressões em relação ao baseline e encerra com código 1 se houver alguma"""
+    if not baseline_path:
+        return
+    regressions = find_regressions(results, baseline_path, key_fields, tolerance)
+    if not regressions:
+        print(f"Sem regressões acima de {tolerance:.0%} em relação a {baseline_path}")
+        return
+    print(f"Regressões acima de {tolerance:.0%} em relação a {baseline_path}:")
+    for line in regressions:
+        print(f"  {line}")
+    sys.exit(1)
@@ -0,0 +1,166 @@
+"""
+Microbenchmarks do WeatherDB: gravação em lote e consultas do histórico.
+
+Para cada tamanho, cria um banco novo em um diretório temporário, grava o
+histórico de várias cidades em ordem cronológica (lotes do mesmo tamanho que a
+thread de escrita usa, com os rollups atualizados na mesma transação) e mede as
+consultas usadas pelas rotas /history, /history/{cidade}/aggregate e /export.
+
+    python -m bench.db_bench                       # 1 mil, 1 milhão e 10 milhões de linhas
+    python -m bench.db_bench --rows 1000,100000 --repeat 20
+    python -m bench.db_bench --baseline bench/results/db-anterior.json
+
+10 milhões de linhas levam uns 10 minutos e ocupam alguns GB em disco.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterator, List, Optional
+
+import config
+from bench.common import environment, latency_summary, report_regressions, save_results
+from database import TIMESTAMP_FORMAT, WeatherDB, encode_cursor
+
+DESCRIPTIONS = ("Céu Limpo", "Algumas Nuvens", "Nublado", "Chuva Leve")
+
+
+def generate_batches(rows: int, cities: int, interval: int, batch_size: int,
+                     now: datetime) -> Iterator[List[tuple]]:
+    """Leituras de `cities` cidades a cada `interval` segundos, terminando em `now`"""
+    steps = -(-rows // cities)
+    start = now - timedelta(seconds=interval * steps)
+    names = [f"cidade {index:04d}" for index in range(cities)]
+    batch: List[tuple] = []
+    produced = 0
+    for step in range(steps):
+        timestamp = (start + timedelta(seconds=interval * step)).strftime(TIMESTAMP_FORMAT)
+        for index, name in enumerate(names):
+            if produced == rows:
+                break
+            seed = step + index
+            batch.append((
+                name, 15 + seed % 20 + 0.5, 40 + seed % 50, seed % 12 + 0.5, 14 + seed % 20,
+                DESCRIPTIONS[seed % len(DESCRIPTIONS)], timestamp,
+            ))
+            produced += 1
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def bench_insert(db: WeatherDB, args, rows: int, now: datetime) -> Dict:
+    conn = db._open_writer()
+    latencies = []
+    elapsed = 0.0
+    try:
+        for batch in generate_batches(rows, args.cities, args.interval, args.batch_size, now):
+            started = time.perf_counter()
+            db._write_batch(conn, batch)
+            duration = time.perf_counter() - started
+            latencies.append(duration)
+            elapsed += duration
+    finally:
+        conn.close()
+    return {
+        "operation": "insert_batch",
+        "batch_size": args.batch_size,
+        "batches": len(latencies),
+        "rows_per_second": round(rows / elapsed, 1) if elapsed else 0.0,
+        **latency_summary(latencies),
+    }
+
+
+def bench_query(operation: str, function: Callable[[str], object], cities: List[str], repeat: int) -> Dict:
+    function(cities[0])  # Aquece a conexão e o cache de páginas
+    latencies = []
+    for index in range(repeat):
+        started = time.perf_counter()
+        function(cities[index % len(cities)])
+        latencies.append(time.perf_counter() - started)
+    return {"operation": operation, "runs": repeat, **latency_summary(latencies)}
+
+
+def query_operations(db: WeatherDB, now: datetime) -> Dict[str, Callable[[str], object]]:
+    hour = now.replace(minute=0, second=0, microsecond=0)
+
+    def next_page(city: str):
+        page = db.get_city_history(city, limit=50)
+        if page:
+            db.get_city_history(city, limit=50, cursor=encode_cursor(page[-1]))
+
+    return {
+        "history_latest": lambda city: db.get_city_history(city, limit=50),
+        "history_next_page": next_page,
+        "history_range_24h": lambda city: db.get_city_history(city, since=now - timedelta(days=1), limit=1000),
+        "aggregate_raw_15m_24h": lambda city: db.aggregate_history(city, 900, since=now - timedelta(days=1)),
+        "aggregate_hourly_7d": lambda city: db.aggregate_history(city, 3600, since=hour - timedelta(days=7)),
+        "aggregate_daily_all": lambda city: db.aggregate_history(city, 86400),
+        "export_city": lambda city: sum(len(rows) for rows in db.iter_history([city], chunk_size=5000)),
+    }
+
+
+def run_size(rows: int, args, log: Callable[[str], None]) -> List[Dict]:
+    workdir = tempfile.mkdtemp(prefix="weatherviz-dbbench-", dir=args.tmpdir)
+    path = os.path.join(workdir, "weather.db")
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    db = WeatherDB(path)
+    try:
+        results = []
+        insert = bench_insert(db, args, rows, now)
+        log(f"{rows:>10} linhas  insert_batch          {insert['rows_per_second']:>12} linhas/s  "
+            f"p95={insert['p95_ms']}ms")
+        results.append(insert)
+
+        cities = [f"cidade {index:04d}" for index in range(min(args.cities, rows))]
+        for operation, function in query_operations(db, now).items():
+            repeat = max(1, args.repeat // 10) if operation == "export_city" else args.repeat
+            result = bench_query(operation, function, cities, repeat)
+            log(f"{rows:>10} linhas  {operation:<22} p50={result['p50_ms']}ms p95={result['p95_ms']}ms "
+                f"p99={result['p99_ms']}ms")
+            results.append(result)
+
+        size = sum(os.path.getsize(os.path.join(workdir, name)) for name in os.listdir(workdir))
+        for result in results:
+            result.update({"rows": rows, "database_bytes": size})
+        return results
+    finally:
+        db.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks do banco de histórico do WeatherViz")
+    parser.add_argument("--rows", type=_int_list, default=[1_000, 1_000_000, 10_000_000],
+                        help="tamanhos do histórico, separados por vírgula")
+    parser.add_argument("--cities", type=int, default=100, help="cidades distintas no histórico")
+    parser.add_argument("--interval", type=int, default=600, help="intervalo entre leituras de uma cidade (s)")
+    parser.add_argument("--batch-size", type=int, default=config.DB_BATCH_SIZE, help="linhas por transação")
+    parser.add_argument("--repeat", type=int, default=50, help="execuções de cada consulta")
+    parser.add_argument("--tmpdir", help="diretório dos bancos temporários (padrão: o do sistema)")
+    parser.add_argument("--output", help="arquivo JSON de saída (padrão: bench/results/db-<data>.json)")
+    parser.add_argument("--baseline", help="resultado anterior para comparação; sai com código 1 se piorar")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="piora tolerada em relação ao baseline")
+    args = parser.parse_args(argv)
+
+    results = []
+    for rows in args.rows:
+        results.extend(run_size(rows, args, print))
+
+    parameters = {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "tmpdir")}
+    path = save_results("db", {"environment": environment(), "parameters": parameters, "results": results},
+                        args.output)
+    print(f"Resultados gravados em {path}")
+    report_regressions(results, args.baseline, ("rows", "operation"), args.tolerance)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Substituto local do OpenWeatherMap para testes de carga.
+
+Serve /weather, /forecast e /group com respostas fixas (derivadas do nome da
+cidade) após uma latência configurável, e devolve erros numa fração das
+chamadas. Aponte a API para ele com OPENWEATHER_BASE_URL:
+
+    python -m bench.fake_owm --port 8900 --latency 0.08 --jitter 0.04 --error-rate 0.01
+    OPENWEATHER_BASE_URL=http://127.0.0.1:8900 OPENWEATHER_API_KEY=bench uvicorn main:app
+"""
+import argparse
+import asyncio
+import os
+import random
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+DESCRIPTIONS = ("céu limpo", "algumas nuvens", "nublado", "chuva leve", "trovoada")
+
+
+def _city_id(name: str) -> int:
+    return zlib.crc32(name.strip().lower().encode()) % 10_000_000
+
+
+def _condition(seed: int) -> Dict:
+    return {"description": DESCRIPTIONS[seed % len(DESCRIPTIONS)], "icon": f"0{seed % 4 + 1}d"}
+
+
+class FakeOpenWeatherMap:
+    def __init__(self, latency: float = 0.05, jitter: float = 0.02, error_rate: float = 0.0,
+                 error_status: int = 500, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        # IDs já servidos, para que /group responda às cidades vistas em /weather
+        self.names: Dict[int, str] = {}
+        self.calls = 0
+
+    def weather_payload(self, name: str, city_id: Optional[int] = None) -> Dict:
+        city_id = _city_id(name) if city_id is None else city_id
+        self.names[city_id] = name
+        return {
+            "id": city_id,
+            "name": name.strip().title(),
+            "sys": {"country": "BR"},
+            "main": {"temp": 15 + city_id % 20 + 0.25, "feels_like": 14 + city_id % 20, "humidity": 40 + city_id % 50},
+            "wind": {"speed": city_id % 12 + 0.5},
+            "weather": [_condition(city_id)],
+        }
+
+    def forecast_payload(self, name: str) -> Dict:
+        city_id = _city_id(name)
+        start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        return {
+            "city": {"id": city_id, "name": name.strip().title(), "country": "BR"},
+            "list": [
+                {
+                    "dt_txt": (start + timedelta(hours=3 * step)).strftime("%Y-%m-%d %H:%M:%S"),
+                    "main": {"temp": 15 + (city_id + step) % 20, "feels_like": 14 + (city_id + step) % 20,
+                             "humidity": 40 + (city_id + step) % 50},
+                    "wind": {"speed": (city_id + step) % 12 + 0.5},
+                    "weather": [_condition(city_id + step)],
+                }
+                for step in range(40)
+            ],
+        }
+
+    async def delay(self) -> Optional[JSONResponse]:
+        """Espera a latência simulada; devolve a resposta de erro quando sorteada"""
+        self.calls += 1
+        await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+        if self.error_rate and self.random.random() < self.error_rate:
+            return JSONResponse({"cod": self.error_status, "message": "simulated error"}, self.error_status)
+        return None
+
+    def city_name(self, request: Request) -> str:
+        name = request.query_params.get("q")
+        if name is None:
+            city_id = int(request.query_params.get("id", 0))
+            name = self.names.get(city_id, f"cidade {city_id}")
+        return name
+
+
+def create_app(fake: FakeOpenWeatherMap) -> FastAPI:
+    app = FastAPI(title="Fake OpenWeatherMap")
+
+    @app.get("/weather")
+    async def weather(request: Request):
+        error = await fake.delay()
+        if error is not None:
+            return error
+        name = fake.city_name(request)
+        if name.lower().startswith("zzz"):
+            return JSONResponse({"cod": "404", "message": "city not found"}, 404)
+        return fake.weather_payload(name)
+
+    @app.get("/forecast")
+    async def forecast(request: Request):
+        error = await fake.delay()
+        if error is not None:
+            return error
+        return fake.forecast_payload(fake.city_name(request))
+
+    @app.get("/group")
+    async def group(id: str):
+        error = await fake.delay()
+        if error is not None:
+            return error
+        ids = [int(value) for value in id.split(",") if value]
+        items = [fake.weather_payload(fake.names[city_id], city_id) for city_id in ids if city_id in fake.names]
+        return {"cnt": len(items), "list": items}
+
+    @app.get("/stats")
+    def stats():
+        return {"calls": fake.calls}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="OpenWeatherMap falso para testes de carga do WeatherViz")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=float(os.getenv("FAKE_OWM_LATENCY", 0.05)),
+                        help="latência média por chamada (s)")
+    parser.add_argument("--jitter", type=float, default=float(os.getenv("FAKE_OWM_JITTER", 0.02)),
+                        help="variação máxima da latência, para mais ou para menos (s)")
+    parser.add_argument("--error-rate", type=float, default=float(os.getenv("FAKE_OWM_ERROR_RATE", 0)),
+                        help="fração das chamadas que falham (0 a 1)")
+    parser.add_argument("--error-status", type=int, default=500, help="status HTTP das falhas simuladas")
+    parser.add_argument("--seed", type=int, default=None, help="semente do sorteio de latência e erros")
+    args = parser.parse_args()
+
+    fake = FakeOpenWeatherMap(args.latency, args.jitter, args.error_rate, args.error_status, args.seed)
+    uvicorn.run(create_app(fake), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,219 @@
+"""
+Teste de carga das rotas da API com o OpenWeatherMap falso (bench/fake_owm.py).
+
+Sobe o OpenWeatherMap falso e a API (uvicorn main:app, com banco em um
+diretório temporário), popula o histórico e mede cada endpoint em níveis fixos
+de concorrência: vazão e latência p50/p95/p99. Os resultados vão para JSON.
+
+    python -m bench.load --concurrency 1,10,50 --duration 10
+    python -m bench.load --baseline bench/results/load-anterior.json
+    python -m bench.load --api-url http://localhost:8000   # API já em execução
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+import httpx
+
+from bench.common import environment, latency_summary, report_regressions, save_results
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = ("weather", "forecast", "compare", "history")
+
+COMPARE_SIZE = 5
+
+
+def city_names(count: int) -> List[str]:
+    return [f"Cidade {index:04d}" for index in range(count)]
+
+
+def request_for(endpoint: str, cities: List[str], index: int) -> str:
+    """Caminho da index-ésima requisição do endpoint, alternando entre as cidades"""
+    city = cities[index % len(cities)]
+    if endpoint == "weather":
+        return f"/weather/{city}"
+    if endpoint == "forecast":
+        return f"/forecast/{city}"
+    if endpoint == "history":
+        return f"/history/{city}?limit=50"
+    if endpoint == "compare":
+        start = index * COMPARE_SIZE % len(cities)
+        chosen = (cities + cities)[start:start + COMPARE_SIZE]
+        return "/compare?cities=" + ",".join(chosen)
+    raise ValueError(f"Endpoint desconhecido: {endpoint}")
+
+
+async def run_level(base_url: str, endpoint: str, cities: List[str], concurrency: int,
+                    duration: float) -> Dict:
+    """`concurrency` clientes em laço fechado por `duration` segundos"""
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    counter = iter(range(sys.maxsize))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        deadline = time.perf_counter() + duration
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                path = request_for(endpoint, cities, next(counter))
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    status = str(response.status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    errors = sum(count for status, count in statuses.items() if not status.startswith(("2", "304")))
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": statuses,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        **latency_summary(latencies),
+    }
+
+
+async def populate(base_url: str, cities: List[str], rounds: int):
+    """Consulta cada cidade algumas vezes: aquece o cache e grava histórico para /history"""
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        for _ in range(rounds):
+            for start in range(0, len(cities), 50):
+                await asyncio.gather(*(client.get(f"/weather/{city}") for city in cities[start:start + 50]))
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Processo encerrou ao iniciar: {' '.join(process.args)}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} não respondeu em {timeout}s")
+
+
+@contextmanager
+def local_stack(args) -> Iterator[str]:
+    """OpenWeatherMap falso + API em subprocessos; produz a URL da API"""
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    api_url = f"http://127.0.0.1:{args.api_port}"
+    workdir = tempfile.mkdtemp(prefix="weatherviz-bench-")
+    env = {
+        **os.environ,
+        "PYTHONPATH": REPO_DIR,
+        "OPENWEATHER_BASE_URL": fake_url,
+        "OPENWEATHER_API_KEY": "bench",
+        # Sem cota, pré-busca nem retenção: só o tráfego medido chega ao OpenWeatherMap falso
+        "OPENWEATHER_CALLS_PER_MINUTE": "0",
+        "OPENWEATHER_CALLS_PER_DAY": "0",
+        "WATCHLIST": "",
+        "RETENTION_INTERVAL": "0",
+    }
+    processes = []
+    try:
+        fake = subprocess.Popen([
+            sys.executable, "-m", "bench.fake_owm", "--port", str(args.fake_port),
+            "--latency", str(args.latency), "--jitter", str(args.jitter), "--error-rate", str(args.error_rate),
+            "--seed", "1",
+        ], cwd=REPO_DIR, env=env)
+        processes.append(fake)
+        wait_ready(f"{fake_url}/stats", fake)
+        api = subprocess.Popen([
+            sys.executable, "-m", "uvicorn", "main:app", "--app-dir", REPO_DIR,
+            "--port", str(args.api_port), "--log-level", "warning",
+        ], cwd=workdir, env=env)
+        processes.append(api)
+        wait_ready(f"{api_url}/health", api)
+        yield api_url
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        # Banco de histórico gravado pela API durante a medição
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+async def run(base_url: str, args, log: Callable[[str], None]) -> List[Dict]:
+    cities = city_names(args.cities)
+    if args.populate_rounds:
+        log(f"Populando histórico de {len(cities)} cidades...")
+        await populate(base_url, cities, args.populate_rounds)
+    results = []
+    for endpoint in args.endpoints:
+        for concurrency in args.concurrency:
+            result = await run_level(base_url, endpoint, cities, concurrency, args.duration)
+            log(
+                f"{endpoint:>9} c={concurrency:<4} {result['throughput_rps']:>9} req/s  "
+                f"p50={result['p50_ms']}ms p95={result['p95_ms']}ms p99={result['p99_ms']}ms  "
+                f"erros={result['errors']}"
+            )
+            results.append(result)
+    return results
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Teste de carga da API do WeatherViz")
+    parser.add_argument("--api-url", help="usa uma API já em execução em vez de subir a pilha local")
+    parser.add_argument("--endpoints", type=lambda value: value.split(","), default=list(ENDPOINTS),
+                        help="endpoints medidos, separados por vírgula (padrão: todos)")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 10, 50],
+                        help="níveis de concorrência, separados por vírgula")
+    parser.add_argument("--duration", type=float, default=10, help="duração de cada nível (s)")
+    parser.add_argument("--cities", type=int, default=200, help="número de cidades distintas consultadas")
+    parser.add_argument("--populate-rounds", type=int, default=3, help="leituras por cidade antes da medição")
+    parser.add_argument("--latency", type=float, default=0.05, help="latência do OpenWeatherMap falso (s)")
+    parser.add_argument("--jitter", type=float, default=0.02, help="variação da latência (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração de falhas do OpenWeatherMap falso")
+    parser.add_argument("--fake-port", type=int, default=8900)
+    parser.add_argument("--api-port", type=int, default=8901)
+    parser.add_argument("--output", help="arquivo JSON de saída (padrão: bench/results/load-<data>.json)")
+    parser.add_argument("--baseline", help="resultado anterior para comparação; sai com código 1 se piorar")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="piora tolerada em relação ao baseline")
+    args = parser.parse_args(argv)
+
+    for endpoint in args.endpoints:
+        if endpoint not in ENDPOINTS:
+            parser.error(f"endpoint inválido: {endpoint}. Use {', '.join(ENDPOINTS)}")
+
+    if args.api_url:
+        results = asyncio.run(run(args.api_url.rstrip("/"), args, print))
+    else:
+        with local_stack(args) as api_url:
+            results = asyncio.run(run(api_url, args, print))
+
+    parameters = {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+    path = save_results("load", {"environment": environment(), "parameters": parameters, "results": results},
+                        args.output)
+    print(f"Resultados gravados em {path}")
+    report_regressions(results, args.baseline, ("endpoint", "concurrency"), args.tolerance)
+
+
+if __name__ == "__main__":
+    main()
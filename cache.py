@@ -0,0 +1,157 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Estados possíveis de uma consulta ao cache
+FRESH = "fresh"
+STALE = "stale"
+MISS = "miss"
+
+
+def normalize_city(city: str) -> str:
+    """Normaliza o nome da cidade para uso em chaves (espaços e caixa)"""
+    return " ".join(city.split()).casefold()
+
+
+def make_key(endpoint: str, city: str, units: str, lang: str) -> str:
+    return f"{endpoint}:{units}:{lang}:{normalize_city(city)}"
+
+
+def _json_size(value: Any) -> int:
+    return len(json.dumps(value, ensure_ascii=False, default=str))
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "stale_until", "size")
+
+    def __init__(self, value: Any, expires_at: float, stale_until: float, size: int):
+        self.value = value
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+        self.size = size
+
+
+class TTLCache:
+    """Cache LRU em memória com TTL por entrada e janela de stale-while-revalidate.
+
+    Entradas expiradas não são removidas na leitura: ficam disponíveis via
+    `peek` até serem despejadas pelo LRU.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 5000,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = _json_size,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._clock = clock
+        self._data: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Tuple[str, Any]:
+        """Retorna (estado, valor), onde estado é FRESH, STALE ou MISS"""
+        now = self._clock()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or now >= entry.stale_until:
+                self.misses += 1
+                return MISS, None
+            self._data.move_to_end(key)
+            if now < entry.expires_at:
+                self.hits += 1
+                return FRESH, entry.value
+            self.stale_hits += 1
+            return STALE, entry.value
+
+    def peek(self, key: str) -> Any:
+        """Retorna o último valor conhecido, mesmo expirado, sem afetar as métricas"""
+        with self._lock:
+            entry = self._data.get(key)
+            return entry.value if entry is not None else None
+
+    def set(self, key: str, value: Any, ttl: float, stale_ttl: float = 0):
+        size = self._sizeof(value)
+        now = self._clock()
+        with self._lock:
+            self._refreshing.discard(key)
+            if self.max_bytes and size > self.max_bytes:
+                return
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._data[key] = _Entry(value, now + ttl, now + ttl + stale_ttl, size)
+            self._bytes += size
+            while self._data and (
+                len(self._data) > self.max_entries
+                or (self.max_bytes and self._bytes > self.max_bytes)
+            ):
+                _, evicted = self._data.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+
+    def items(self) -> List[Tuple[str, Any, float, float]]:
+        """(chave, valor, segundos até vencer, segundos até sair da janela de stale), do menos ao mais usado.
+
+        Entradas já vencidas vêm com tempos negativos (ainda servem como último valor conhecido).
+        """
+        now = self._clock()
+        with self._lock:
+            return [
+                (key, entry.value, entry.expires_at - now, entry.stale_until - now)
+                for key, entry in self._data.items()
+            ]
+
+    def delete(self, key: str):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry.size
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._refreshing.clear()
+            self._bytes = 0
+
+    def begin_refresh(self, key: str) -> bool:
+        """Marca a chave como em revalidação; False se já houver uma em andamento"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, key: str):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "refreshing": len(self._refreshing),
+            }
+
+    def __len__(self) -> int:
+        return len(self._data)
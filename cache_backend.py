@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+
+import config
+from cache import FRESH, MISS, STALE, TTLCache
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import RedisError
+except ImportError:  # Só necessário com CACHE_BACKEND=redis
+    aioredis = None
+    RedisError = OSError
+
+logger = logging.getLogger(__name__)
+
+# Apaga a trava só se ainda for do mesmo dono (pode ter expirado e sido tomada por outro)
+_RELEASE_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class CacheBackend:
+    """Interface dos caches de respostas do AsyncWeatherService.
+
+    Os valores são dicts serializáveis em JSON. `acquire_lock`/`release_lock`
+    garantem que só um processo busque a mesma chave no OpenWeatherMap por vez;
+    dentro de cada processo, o SingleFlight já faz isso.
+    """
+
+    async def get(self, key: str) -> Tuple[str, Any]:
+        """Retorna (estado, valor), onde estado é FRESH, STALE ou MISS"""
+        raise NotImplementedError
+
+    async def get_many(self, keys: List[str]) -> List[Tuple[str, Any]]:
+        raise NotImplementedError
+
+    async def peek(self, key: str) -> Any:
+        """Último valor conhecido, mesmo vencido, ou None"""
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: float, stale_ttl: float = 0):
+        raise NotImplementedError
+
+    async def set_many(self, items: List[Tuple[str, Any]], ttl: float, stale_ttl: float = 0):
+        raise NotImplementedError
+
+    async def acquire_lock(self, key: str, ttl: float) -> Optional[str]:
+        """Token da trava da chave, ou None se outro processo a detém"""
+        raise NotImplementedError
+
+    async def release_lock(self, key: str, token: str):
+        raise NotImplementedError
+
+    async def wait_unlocked(self, key: str, timeout: float):
+        """Espera a trava da chave ser liberada (ou expirar), até `timeout` segundos"""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def snapshot(self) -> List[Tuple[str, Any, float, float]]:
+        """Entradas a persistir entre reinícios, com instantes do relógio de parede.
+
+        Cada item é (chave, valor, vence em, sai do stale em). Backends compartilhados,
+        que já sobrevivem ao processo, devolvem lista vazia.
+        """
+        return []
+
+    async def restore(self, entries: List[Tuple[str, Any, float, float]]):
+        """Recarrega entradas de `snapshot()`, mantendo os instantes de vencimento originais"""
+        pass
+
+    async def close(self):
+        pass
+
+
+class MemoryCache(CacheBackend):
+    """Cache do próprio processo (TTLCache). Cada worker tem o seu."""
+
+    def __init__(self, store: Optional[TTLCache] = None):
+        self.store = store if store is not None else TTLCache(config.CACHE_MAX_ENTRIES, config.CACHE_MAX_BYTES)
+
+    async def get(self, key: str) -> Tuple[str, Any]:
+        return self.store.get(key)
+
+    async def get_many(self, keys: List[str]) -> List[Tuple[str, Any]]:
+        return [self.store.get(key) for key in keys]
+
+    async def peek(self, key: str) -> Any:
+        return self.store.peek(key)
+
+    async def set(self, key: str, value: Any, ttl: float, stale_ttl: float = 0):
+        self.store.set(key, value, ttl, stale_ttl)
+
+    async def set_many(self, items: List[Tuple[str, Any]], ttl: float, stale_ttl: float = 0):
+        for key, value in items:
+            self.store.set(key, value, ttl, stale_ttl)
+
+    async def acquire_lock(self, key: str, ttl: float) -> Optional[str]:
+        # Sem outros processos para coordenar: a trava só evita revalidações duplicadas
+        return key if self.store.begin_refresh(key) else None
+
+    async def release_lock(self, key: str, token: str):
+        self.store.end_refresh(key)
+
+    async def wait_unlocked(self, key: str, timeout: float):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", **self.store.stats()}
+
+    async def snapshot(self) -> List[Tuple[str, Any, float, float]]:
+        now = time.time()
+        return [
+            (key, value, now + fresh_in, now + stale_in)
+            for key, value, fresh_in, stale_in in self.store.items()
+        ]
+
+    async def restore(self, entries: List[Tuple[str, Any, float, float]]):
+        now = time.time()
+        for key, value, expires_at, stale_until in entries:
+            if self.store.peek(key) is None:
+                self.store.set(key, value, expires_at - now, stale_until - expires_at)
+
+
+class RedisCache(CacheBackend):
+    """Cache compartilhado entre workers e réplicas em um servidor Redis.
+
+    Cada entrada guarda o valor e os instantes (relógio de parede) em que deixa
+    de ser fresca e de poder ser servida vencida; a chave expira no Redis
+    `last_known_ttl` segundos depois disso, mantendo o último valor conhecido
+    para quando o OpenWeatherMap estiver fora. Falhas do Redis são tratadas
+    como cache vazio: a API continua respondendo direto do OpenWeatherMap.
+    """
+
+    def __init__(self, url: str, prefix: str = "weatherviz:", client=None, last_known_ttl: float = 3600,
+                 poll_interval: float = 0.05):
+        if client is None:
+            if aioredis is None:
+                raise RuntimeError("CACHE_BACKEND=redis requer o pacote redis")
+            client = aioredis.from_url(url)
+        self._client = client
+        self.prefix = prefix
+        self.last_known_ttl = last_known_ttl
+        self.poll_interval = poll_interval
+        self._release = client.register_script(_RELEASE_LOCK)
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.lock_waits = 0
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def _lock_key(self, key: str) -> str:
+        return f"{self.prefix}lock:{key}"
+
+    def _error(self, operation: str, error: Exception):
+        self.errors += 1
+        logger.warning("Falha no Redis (%s): %s", operation, error)
+
+    def _decode(self, raw: Optional[bytes], count: bool = True) -> Tuple[str, Any]:
+        if raw is None:
+            if count:
+                self.misses += 1
+            return MISS, None
+        expires_at, stale_until, value = orjson.loads(raw)
+        now = time.time()
+        if now < expires_at:
+            state = FRESH
+        elif now < stale_until:
+            state = STALE
+        else:
+            state = MISS
+        if count:
+            if state == FRESH:
+                self.hits += 1
+            elif state == STALE:
+                self.stale_hits += 1
+            else:
+                self.misses += 1
+        return state, value if state != MISS else None
+
+    def _encode(self, value: Any, ttl: float, stale_ttl: float) -> Tuple[bytes, int]:
+        now = time.time()
+        raw = orjson.dumps([now + ttl, now + ttl + stale_ttl, value])
+        return raw, int((ttl + stale_ttl + self.last_known_ttl) * 1000)
+
+    async def get(self, key: str) -> Tuple[str, Any]:
+        try:
+            raw = await self._client.get(self._key(key))
+        except RedisError as e:
+            self._error("get", e)
+            return MISS, None
+        return self._decode(raw)
+
+    async def get_many(self, keys: List[str]) -> List[Tuple[str, Any]]:
+        """Todas as chaves em um único MGET (uma ida e volta ao Redis)"""
+        if not keys:
+            return []
+        try:
+            raws = await self._client.mget([self._key(key) for key in keys])
+        except RedisError as e:
+            self._error("mget", e)
+            return [(MISS, None)] * len(keys)
+        return [self._decode(raw) for raw in raws]
+
+    async def peek(self, key: str) -> Any:
+        try:
+            raw = await self._client.get(self._key(key))
+        except RedisError as e:
+            self._error("get", e)
+            return None
+        return orjson.loads(raw)[2] if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: float, stale_ttl: float = 0):
+        raw, expire_ms = self._encode(value, ttl, stale_ttl)
+        try:
+            await self._client.set(self._key(key), raw, px=expire_ms)
+        except RedisError as e:
+            self._error("set", e)
+
+    async def set_many(self, items: List[Tuple[str, Any]], ttl: float, stale_ttl: float = 0):
+        if not items:
+            return
+        pipe = self._client.pipeline(transaction=False)
+        for key, value in items:
+            raw, expire_ms = self._encode(value, ttl, stale_ttl)
+            pipe.set(self._key(key), raw, px=expire_ms)
+        try:
+            await pipe.execute()
+        except RedisError as e:
+            self._error("set", e)
+
+    async def acquire_lock(self, key: str, ttl: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+        try:
+            acquired = await self._client.set(self._lock_key(key), token, nx=True, px=int(ttl * 1000))
+        except RedisError as e:
+            # Sem Redis não há como coordenar: cada processo busca por conta própria
+            self._error("lock", e)
+            return token
+        return token if acquired else None
+
+    async def release_lock(self, key: str, token: str):
+        try:
+            await self._release(keys=[self._lock_key(key)], args=[token])
+        except RedisError as e:
+            self._error("unlock", e)
+
+    async def wait_unlocked(self, key: str, timeout: float):
+        self.lock_waits += 1
+        deadline = time.monotonic() + timeout
+        try:
+            while time.monotonic() < deadline and await self._client.exists(self._lock_key(key)):
+                await asyncio.sleep(self.poll_interval)
+        except RedisError as e:
+            self._error("exists", e)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "backend": "redis",
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+            "errors": self.errors,
+            "lock_waits": self.lock_waits,
+        }
+
+    async def close(self):
+        await self._client.close()
+
+
+def create_cache_backend() -> CacheBackend:
+    """Backend escolhido por CACHE_BACKEND ("memory" ou "redis")"""
+    if config.CACHE_BACKEND == "memory":
+        return MemoryCache()
+    if config.CACHE_BACKEND == "redis":
+        return RedisCache(config.REDIS_URL, config.REDIS_KEY_PREFIX, last_known_ttl=config.CACHE_LAST_KNOWN_TTL)
+    raise ValueError(f"CACHE_BACKEND inválido: '{config.CACHE_BACKEND}'. Use 'memory' ou 'redis'")
@@ -0,0 +1,80 @@
+import threading
+import time
+from typing import Callable, Dict
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class UpstreamUnavailable(Exception):
+    """OpenWeatherMap fora do ar, com erro 5xx ou sem responder"""
+
+
+class CircuitOpen(UpstreamUnavailable):
+    """Chamada recusada sem ir ao OpenWeatherMap porque o circuito está aberto"""
+
+
+class CircuitBreaker:
+    """Disjuntor para o OpenWeatherMap.
+
+    Após `failure_threshold` falhas seguidas o circuito abre e as chamadas falham
+    imediatamente. Depois de `reset_timeout` segundos uma única chamada de teste
+    é liberada: se funcionar o circuito fecha, senão volta a abrir.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self._clock() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = self._clock()
+            self._probing = False
+
+    def release(self):
+        """Libera a chamada de teste sem resultado (ex.: cancelada antes da resposta)"""
+        with self._lock:
+            self._probing = False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            retry_in = 0.0
+            if self.state == OPEN:
+                retry_in = max(0.0, self.reset_timeout - (self._clock() - self.opened_at))
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "rejected": self.rejected,
+                "retry_in": round(retry_in, 1),
+            }
@@ -0,0 +1,37 @@
+import hashlib
+from typing import Any, Dict, Optional
+
+import orjson
+from fastapi import Request, Response
+
+from metrics import STAGE_LATENCY
+
+
+def etag_for(body: bytes) -> str:
+    # Fraca: a mesma representação pode ir comprimida ou não pelo GZipMiddleware
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Compara If-None-Match com o ETag atual (comparação fraca, RFC 9110)"""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag.removeprefix("W/")
+                                    for candidate in candidates)
+
+
+def conditional_json(request: Request, payload: Any, cache_control: str,
+                     headers: Optional[Dict[str, str]] = None) -> Response:
+    """JSON com ETag e Cache-Control, ou 304 sem corpo se o cliente já tem essa versão.
+
+    O corpo é serializado uma única vez com orjson, e os mesmos bytes servem para
+    o ETag e para a resposta; a revalidação pelo response_model não é refeita.
+    """
+    with STAGE_LATENCY.time("serialization"):
+        body = orjson.dumps(payload)
+        etag = etag_for(body)
+    headers = {**(headers or {}), "ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
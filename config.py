@@ -0,0 +1,119 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+# Cache das respostas do OpenWeatherMap (segundos)
+WEATHER_CACHE_TTL = _env_float("WEATHER_CACHE_TTL", 300)
+FORECAST_CACHE_TTL = _env_float("FORECAST_CACHE_TTL", 1800)
+CACHE_STALE_TTL = _env_float("CACHE_STALE_TTL", 600)
+CACHE_MAX_ENTRIES = _env_int("CACHE_MAX_ENTRIES", 5000)
+CACHE_MAX_BYTES = _env_int("CACHE_MAX_BYTES", 32 * 1024 * 1024)
+
+# Backend do cache: "memory" (por processo) ou "redis" (compartilhado entre workers)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_KEY_PREFIX = os.getenv("REDIS_KEY_PREFIX", "weatherviz:")
+# Tempo extra em que o último valor conhecido fica no Redis após vencer
+CACHE_LAST_KNOWN_TTL = _env_float("CACHE_LAST_KNOWN_TTL", 3600)
+# Duração máxima da trava de busca de uma chave entre workers
+CACHE_LOCK_TTL = _env_float("CACHE_LOCK_TTL", 15)
+
+# Cliente HTTP do OpenWeatherMap
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5").rstrip("/")
+UPSTREAM_TIMEOUT = _env_float("UPSTREAM_TIMEOUT", 10)
+UPSTREAM_CONNECT_TIMEOUT = _env_float("UPSTREAM_CONNECT_TIMEOUT", 3)
+UPSTREAM_MAX_CONNECTIONS = _env_int("UPSTREAM_MAX_CONNECTIONS", 200)
+UPSTREAM_MAX_KEEPALIVE = _env_int("UPSTREAM_MAX_KEEPALIVE", 100)
+UPSTREAM_RETRIES = _env_int("UPSTREAM_RETRIES", 2)
+UPSTREAM_BACKOFF = _env_float("UPSTREAM_BACKOFF", 0.3)
+
+# Comparação entre cidades
+MAX_COMPARE_CITIES = _env_int("MAX_COMPARE_CITIES", 100)
+COMPARE_CONCURRENCY = _env_int("COMPARE_CONCURRENCY", 20)
+COMPARE_CITY_TIMEOUT = _env_float("COMPARE_CITY_TIMEOUT", 8)
+
+# Gravação do histórico em lote
+DB_BATCH_SIZE = _env_int("DB_BATCH_SIZE", 500)
+DB_FLUSH_INTERVAL = _env_float("DB_FLUSH_INTERVAL_MS", 100) / 1000
+DB_QUEUE_MAX = _env_int("DB_QUEUE_MAX", 10000)
+
+# Backend do histórico: "sqlite" (arquivo local) ou "postgres" (compartilhado entre réplicas)
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "sqlite").lower()
+DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_SIZE = _env_int("DB_POOL_SIZE", 10)
+
+# Retenção do histórico
+RETENTION_RAW_DAYS = _env_float("RETENTION_RAW_DAYS", 30)
+RETENTION_HOURLY_DAYS = _env_float("RETENTION_HOURLY_DAYS", 365)
+RETENTION_BATCH_SIZE = _env_int("RETENTION_BATCH_SIZE", 2000)
+RETENTION_PAUSE = _env_float("RETENTION_PAUSE", 0.05)
+RETENTION_VACUUM_PAGES = _env_int("RETENTION_VACUUM_PAGES", 1000)
+RETENTION_INTERVAL = _env_float("RETENTION_INTERVAL", 3600)
+
+# Pré-busca das cidades monitoradas
+WATCHLIST = [city.strip() for city in os.getenv("WATCHLIST", "").split(",") if city.strip()]
+WATCHLIST_FILE = os.getenv("WATCHLIST_FILE")
+PREFETCH_INTERVAL = _env_float("PREFETCH_INTERVAL", 300)
+PREFETCH_FORECAST_INTERVAL = _env_float("PREFETCH_FORECAST_INTERVAL", 1800)
+PREFETCH_UNITS = os.getenv("PREFETCH_UNITS", "metric")
+PREFETCH_LANG = os.getenv("PREFETCH_LANG", "pt_br")
+
+# Cota de chamadas ao OpenWeatherMap, para o servidor todo (0 desativa o limite)
+OPENWEATHER_CALLS_PER_MINUTE = _env_float("OPENWEATHER_CALLS_PER_MINUTE", 60)
+OPENWEATHER_CALLS_PER_DAY = _env_float("OPENWEATHER_CALLS_PER_DAY", 33000)
+RATE_LIMIT_MAX_WAIT = _env_float("RATE_LIMIT_MAX_WAIT", 5)
+RATE_LIMIT_PREFETCH_MAX_WAIT = _env_float("RATE_LIMIT_PREFETCH_MAX_WAIT", 60)
+# Com vários workers, fração das cotas reservada à pré-busca do worker que detém a trava de segundo plano
+PREFETCH_QUOTA_SHARE = min(max(_env_float("PREFETCH_QUOTA_SHARE", 0.2), 0.0), 0.9)
+
+# Consulta em lote (/weather/batch)
+MAX_BATCH_CITIES = _env_int("MAX_BATCH_CITIES", 300)
+BATCH_TIMEOUT = _env_float("BATCH_TIMEOUT", 15)
+
+# Índice local de cidades (dump city.list.json[.gz] do OpenWeatherMap)
+CITY_LIST_PATH = os.getenv("CITY_LIST_PATH")
+
+# Cache negativo e disjuntor do OpenWeatherMap
+NEGATIVE_CACHE_TTL = _env_float("NEGATIVE_CACHE_TTL", 120)
+NEGATIVE_CACHE_MAX_ENTRIES = _env_int("NEGATIVE_CACHE_MAX_ENTRIES", 10000)
+CIRCUIT_FAILURE_THRESHOLD = _env_int("CIRCUIT_FAILURE_THRESHOLD", 5)
+CIRCUIT_RESET_TIMEOUT = _env_float("CIRCUIT_RESET_TIMEOUT", 30)
+
+# Exportação do histórico: linhas lidas do banco por bloco
+EXPORT_CHUNK_SIZE = _env_int("EXPORT_CHUNK_SIZE", 5000)
+
+# Compressão gzip das respostas a partir deste tamanho (bytes)
+GZIP_MIN_SIZE = _env_int("GZIP_MIN_SIZE", 1024)
+
+# Assinaturas ao vivo (/live, Server-Sent Events)
+LIVE_REFRESH_INTERVAL = _env_float("LIVE_REFRESH_INTERVAL", 60)
+LIVE_KEEPALIVE = _env_float("LIVE_KEEPALIVE", 15)
+LIVE_MAX_CITIES = _env_int("LIVE_MAX_CITIES", 50)
+LIVE_MAX_SUBSCRIBERS = _env_int("LIVE_MAX_SUBSCRIBERS", 10000)
+
+# Métricas no formato do Prometheus em /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() not in ("0", "false", "no")
+
+# Implantação com vários workers (gunicorn -c gunicorn.conf.py main:app)
+# Arquivo em que o cache em memória é persistido para aquecer o próximo início (vazio: desativado)
+CACHE_SNAPSHOT_PATH = os.getenv("CACHE_SNAPSHOT_PATH")
+CACHE_SNAPSHOT_INTERVAL = _env_float("CACHE_SNAPSHOT_INTERVAL", 60)
+# Tempo para concluir as requisições em andamento após SIGTERM (segundos)
+GRACEFUL_TIMEOUT = _env_float("GRACEFUL_TIMEOUT", 30)
+# Número de workers (definido por gunicorn.conf.py): as cotas do OpenWeatherMap são divididas entre eles
+WORKERS = max(1, _env_int("WEATHERVIZ_WORKERS", 1))
+# Trava que elege o worker que roda pré-busca e retenção (vazio: todo processo roda)
+BACKGROUND_LOCK_PATH = os.getenv("BACKGROUND_LOCK_PATH")
+BACKGROUND_LOCK_RETRY = _env_float("BACKGROUND_LOCK_RETRY", 30)
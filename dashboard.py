@@ -6,6 +6,11 @@ from datetime import datetime
 import pandas as pd
 import numpy as np
 import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # Configuração da página
 st.set_page_config(
@@ -30,56 +35,119 @@ st.markdown("""
 # URL da API
 API_BASE_URL = st.secrets.get("API_BASE_URL", "http://localhost:8000")
 
-# Função removida para melhor performance
+# TTLs alinhados ao cache da API (WEATHER_CACHE_TTL e FORECAST_CACHE_TTL)
+WEATHER_TTL = 300
+FORECAST_TTL = 1800
+HISTORY_TTL = 60
+REQUEST_TIMEOUT = 10
+# Respostas guardadas para revalidação com If-None-Match (compartilhadas entre sessões)
+ETAG_MAX_ENTRIES = 200
+
+@st.cache_resource
+def get_session():
+    """Sessão HTTP compartilhada entre execuções e usuários (conexões keep-alive)"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=20)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+class EtagStore:
+    """Últimas respostas com ETag, limitadas às ETAG_MAX_ENTRIES URLs mais recentes (LRU)"""
+
+    def __init__(self, max_entries=ETAG_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, etag, data):
+        with self._lock:
+            self._data[key] = (etag, data)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+@st.cache_resource
+def get_etag_store():
+    """Última resposta de cada URL com seu ETag, para revalidar com If-None-Match"""
+    return EtagStore()
+
+def _get_json(path, params=None):
+    """GET na API; um 304 reaproveita o corpo anterior. Falhas geram exceção (e não entram no cache)"""
+    url = f"{API_BASE_URL}{path}"
+    key = (url, tuple(sorted((params or {}).items())))
+    store = get_etag_store()
+    cached = store.get(key)
+    headers = {"If-None-Match": cached[0]} if cached is not None else {}
+    response = get_session().get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
+    if response.status_code == 304 and cached is not None:
+        return cached[1]
+    response.raise_for_status()
+    data = response.json()
+    if "ETag" in response.headers:
+        store.set(key, response.headers["ETag"], data)
+    return data
+
+@st.cache_data(ttl=WEATHER_TTL, show_spinner=False)
+def _cached_weather(city, units, lang):
+    return _get_json(f"/weather/{city}", {"units": units, "lang": lang})
+
+@st.cache_data(ttl=HISTORY_TTL, show_spinner=False)
+def _cached_history(city):
+    return _get_json(f"/history/{city}")
+
+@st.cache_data(ttl=FORECAST_TTL, show_spinner=False)
+def _cached_forecast(city, units, lang):
+    # Colunas paralelas: menor payload e conversão direta em DataFrame
+    return _get_json(f"/forecast/{city}", {"units": units, "lang": lang, "format": "columnar"})
+
+@st.cache_data(ttl=WEATHER_TTL, show_spinner=False)
+def _cached_comparison(cities, units, lang):
+    return _get_json("/compare", {"cities": ",".join(cities), "units": units, "lang": lang})
 
 def fetch_weather(city, units="metric", lang="pt_br"):
     """Busca dados do clima na API"""
     try:
-        params = {"units": units, "lang": lang}
-        response = requests.get(f"{API_BASE_URL}/weather/{city}", params=params)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return None
+        return _cached_weather(city, units, lang)
     except:
         return None
 
 def fetch_history(city):
     """Busca histórico na API"""
     try:
-        response = requests.get(f"{API_BASE_URL}/history/{city}")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return []
+        return _cached_history(city)
     except:
         return []
 
 def fetch_forecast(city, units="metric", lang="pt_br"):
     """Busca previsão de 5 dias na API"""
     try:
-        params = {"units": units, "lang": lang}
-        response = requests.get(f"{API_BASE_URL}/forecast/{city}", params=params)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return None
+        return _cached_forecast(city, units, lang)
     except:
         return None
 
 def fetch_comparison(cities, units="metric", lang="pt_br"):
     """Compara múltiplas cidades"""
     try:
-        cities_str = ','.join(cities)
-        params = {"units": units, "lang": lang}
-        response = requests.get(f"{API_BASE_URL}/compare?cities={cities_str}", params=params)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return None
+        return _cached_comparison(tuple(cities), units, lang)
     except:
         return None
 
+def fetch_weather_and_history(city, units="metric", lang="pt_br"):
+    """Clima atual e histórico em paralelo: a página espera uma única ida e volta à API"""
+    ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(max_workers=2, initializer=add_script_run_ctx, initargs=(None, ctx)) as executor:
+        weather = executor.submit(fetch_weather, city, units, lang)
+        history = executor.submit(fetch_history, city)
+        return weather.result(), history.result()
+
 # Interface principal
 st.title("WeatherViz Dashboard")
 st.markdown("**Sistema profissional de consulta climática com histórico**")
@@ -116,7 +184,7 @@ temp_unit = "°C" if units == "Celsius" else "°F"
 
 # Layout principal
 if tab == "Clima Atual" and search_button and city_input:
-    weather_data = fetch_weather(city_input, api_units, api_lang)
+    weather_data, history = fetch_weather_and_history(city_input, api_units, api_lang)
     
     if weather_data:
         # Dados atuais
@@ -140,20 +208,14 @@ if tab == "Clima Atual" and search_button and city_input:
         
         # Histórico
         st.subheader("Histórico de Consultas")
-        history = fetch_history(city_input)
         
         if history:
             df = pd.DataFrame(history)
             df['timestamp'] = pd.to_datetime(df['timestamp'])
             
-            # Botão de exportar histórico
-            csv_data = df.to_csv(index=False)
-            st.download_button(
-                label="Baixar Histórico (CSV)",
-                data=csv_data,
-                file_name=f"historico_{city_input.replace(' ', '_')}.csv",
-                mime="text/csv"
-            )
+            # Histórico completo gerado em streaming pela API, sem montar o CSV aqui
+            export_url = f"{API_BASE_URL}/export?cities={quote(city_input)}&format=csv"
+            st.markdown(f"[Baixar Histórico Completo (CSV)]({export_url})")
             
             # Análise dos dados para insights
             temp_max = df['temperature'].max()
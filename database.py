@@ -1,14 +1,482 @@
+import base64
+import calendar
+import logging
+import os
+import queue
 import sqlite3
-from datetime import datetime
-from typing import List, Dict
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Iterator, List, Dict, Optional, Tuple
 
-class WeatherDB:
-    def __init__(self, db_path: str = "weather.db"):
+import config
+from metrics import STAGE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+INSERT_WEATHER = """
+    INSERT INTO weather_history
+    (city, temperature, humidity, wind_speed, feels_like, description, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+INSERT_SNAPSHOT = """
+    INSERT OR IGNORE INTO forecast_snapshots
+    (city, target_time, issued_at, temperature, feels_like, humidity, wind_speed, description)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Colunas do histórico na ordem usada pela exportação
+EXPORT_COLUMNS = ("id", "city", "timestamp", "temperature", "feels_like", "humidity", "wind_speed", "description")
+
+METRICS = ("temperature", "humidity", "wind_speed", "feels_like")
+
+# Rollups mantidos incrementalmente: tabela weather_rollup_<nome> -> largura do intervalo (s)
+ROLLUPS = {"hourly": 3600, "daily": 86400}
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def rollup_columns() -> List[str]:
+    return ["city", "bucket", "count"] + [
+        f"{metric}_{stat}" for metric in METRICS for stat in ("sum", "min", "max")
+    ]
+
+
+def _rollup_table_sql(name: str) -> str:
+    metric_columns = "".join(
+        f"{metric}_sum REAL NOT NULL, {metric}_min REAL NOT NULL, {metric}_max REAL NOT NULL, "
+        for metric in METRICS
+    )
+    return f"""
+        CREATE TABLE IF NOT EXISTS weather_rollup_{name} (
+            city TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            {metric_columns}
+            PRIMARY KEY (city, bucket)
+        ) WITHOUT ROWID
+    """
+
+
+def _rollup_backfill_sql(name: str, where: str = "", keep_existing: bool = False) -> str:
+    seconds = ROLLUPS[name]
+    metric_columns = ", ".join(f"SUM({metric}), MIN({metric}), MAX({metric})" for metric in METRICS)
+    return f"""
+        INSERT {"OR IGNORE " if keep_existing else ""}INTO weather_rollup_{name} ({", ".join(rollup_columns())})
+        SELECT city, (CAST(strftime('%s', timestamp) AS INTEGER) / {seconds}) * {seconds} AS bucket,
+               COUNT(*), {metric_columns}
+        FROM weather_history {where}
+        GROUP BY city, bucket
+    """
+
+
+def _rollup_upsert_sql(name: str) -> str:
+    columns = rollup_columns()
+    updates = ["count = count + excluded.count"]
+    for metric in METRICS:
+        updates += [
+            f"{metric}_sum = {metric}_sum + excluded.{metric}_sum",
+            f"{metric}_min = MIN({metric}_min, excluded.{metric}_min)",
+            f"{metric}_max = MAX({metric}_max, excluded.{metric}_max)",
+        ]
+    return f"""
+        INSERT INTO weather_rollup_{name} ({", ".join(columns)})
+        VALUES ({", ".join("?" for _ in columns)})
+        ON CONFLICT (city, bucket) DO UPDATE SET {", ".join(updates)}
+    """
+
+
+# Migrações de schema, aplicadas em ordem conforme PRAGMA user_version
+MIGRATIONS = [
+    # 1: histórico por cidade e período sem varrer a tabela
+    [
+        "CREATE INDEX IF NOT EXISTS idx_weather_history_city_timestamp "
+        "ON weather_history (city, timestamp)",
+    ],
+    # 2: rollups horários e diários, preenchidos com o histórico existente
+    [_rollup_table_sql(name) for name in ROLLUPS] + [_rollup_backfill_sql(name) for name in ROLLUPS],
+    # 3: seleção das linhas a expirar pela retenção
+    [
+        "CREATE INDEX IF NOT EXISTS idx_weather_history_timestamp ON weather_history (timestamp)",
+    ],
+    # 4: previsões gravadas a cada consulta ao OpenWeatherMap. A chave primária
+    # (city, target_time, issued_at) é o índice da consulta "as-of": a previsão
+    # mais recente de uma cidade para um horário é uma única busca na árvore
+    [
+        """
+        CREATE TABLE IF NOT EXISTS forecast_snapshots (
+            city TEXT NOT NULL,
+            target_time TEXT NOT NULL,
+            issued_at TEXT NOT NULL,
+            temperature REAL NOT NULL,
+            feels_like REAL NOT NULL,
+            humidity INTEGER NOT NULL,
+            wind_speed REAL NOT NULL,
+            description TEXT NOT NULL,
+            PRIMARY KEY (city, target_time, issued_at)
+        ) WITHOUT ROWID
+        """,
+    ],
+]
+
+BUCKET_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+_STOP = object()
+
+
+def _utc_timestamp() -> str:
+    # Mesmo formato de CURRENT_TIMESTAMP do SQLite
+    return datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def to_epoch(timestamp: str) -> int:
+    return calendar.timegm(time.strptime(timestamp, TIMESTAMP_FORMAT))
+
+
+def _history_row(city: str, weather_data: Dict, timestamp: str) -> tuple:
+    return (
+        city.lower(),
+        weather_data['temperature'],
+        weather_data['humidity'],
+        weather_data['wind_speed'],
+        weather_data['feels_like'],
+        weather_data['description'],
+        timestamp
+    )
+
+
+def _snapshot_rows(city: str, forecast: Dict, issued_at: str) -> List[tuple]:
+    """Linhas de forecast_snapshots a partir da previsão em colunas (parse_forecast_columns)"""
+    columns = forecast["forecasts"]
+    return [
+        (city.lower(), target_time, issued_at, temperature, feels_like, humidity, wind_speed, description)
+        for target_time, temperature, feels_like, humidity, wind_speed, description in zip(
+            columns["datetime"], columns["temperature"], columns["feels_like"], columns["humidity"],
+            columns["wind_speed"], columns["description"],
+        )
+    ]
+
+
+class _ForecastSnapshot:
+    """Item da fila de escrita com as linhas de uma previsão"""
+
+    __slots__ = ("rows",)
+
+    def __init__(self, rows: List[tuple]):
+        self.rows = rows
+
+
+def as_of_result(city: str, observed: Optional[Dict], forecast: Optional[Dict]) -> Optional[Dict]:
+    """Escolhe o valor mais recente entre a última leitura e a última previsão (leitura em caso de empate)"""
+    if observed is None and forecast is None:
+        return None
+    if forecast is None or (observed is not None and observed["timestamp"] >= forecast["timestamp"]):
+        return {"city": city, "source": "observed", **observed, "issued_at": None}
+    return {"city": city, "source": "forecast", **forecast}
+
+
+def rollup_batch(rows: List[tuple], seconds: int) -> List[tuple]:
+    """Pré-agrega um lote de linhas do histórico por (cidade, intervalo)"""
+    groups: Dict[tuple, list] = {}
+    for row in rows:
+        city, values, timestamp = row[0], row[1:5], row[6]
+        key = (city, to_epoch(timestamp) // seconds * seconds)
+        acc = groups.get(key)
+        if acc is None:
+            groups[key] = [1] + [value for value in values for _ in range(3)]
+            continue
+        acc[0] += 1
+        for index, value in enumerate(values):
+            base = 1 + 3 * index
+            acc[base] += value
+            acc[base + 1] = min(acc[base + 1], value)
+            acc[base + 2] = max(acc[base + 2], value)
+    return [key + tuple(acc) for key, acc in groups.items()]
+
+
+def to_db_timestamp(value: datetime) -> str:
+    """Converte um datetime (UTC se sem fuso) para o formato gravado no banco"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+def encode_cursor(row: Dict) -> str:
+    """Cursor opaco de paginação a partir do último registro da página"""
+    raw = f"{row['timestamp']}|{row['id']}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def parse_bucket(bucket: str) -> int:
+    """Converte '15m', '1h', '1d' (ou segundos) em segundos"""
+    bucket = bucket.strip().lower()
+    try:
+        if bucket[-1:] in BUCKET_UNITS:
+            seconds = int(bucket[:-1]) * BUCKET_UNITS[bucket[-1]]
+        else:
+            seconds = int(bucket)
+    except ValueError:
+        raise ValueError(f"Intervalo inválido: '{bucket}'")
+    if seconds <= 0:
+        raise ValueError(f"Intervalo inválido: '{bucket}'")
+    return seconds
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return timestamp, int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Cursor inválido")
+
+
+class HistoryStore:
+    """Interface dos armazenamentos do histórico de consultas.
+
+    Escritas são enfileiradas e gravadas por uma thread dedicada em lotes de até
+    `batch_size` linhas ou a cada `flush_interval` segundos, uma transação por
+    lote. Cada backend implementa a conexão da thread de escrita, a gravação do
+    lote e as consultas.
+    """
+
+    def __init__(self, batch_size: Optional[int] = None, flush_interval: Optional[float] = None):
+        self.batch_size = batch_size or config.DB_BATCH_SIZE
+        self.flush_interval = flush_interval if flush_interval is not None else config.DB_FLUSH_INTERVAL
+        self._writer_lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_pid: Optional[int] = None
+        self._queue: "queue.Queue" = queue.Queue(maxsize=config.DB_QUEUE_MAX)
+        self.dropped = 0
+
+    def save_weather_data(self, city: str, weather_data: Dict):
+        """Enfileira o registro para gravação em lote; não bloqueia"""
+        self._enqueue(_history_row(city, weather_data, _utc_timestamp()), 1, f"registro de '{city}'")
+
+    def save_weather_batch(self, items: List[Tuple[str, Dict]]):
+        """Enfileira vários registros para gravação na mesma transação"""
+        if not items:
+            return
+        timestamp = _utc_timestamp()
+        rows = [_history_row(city, weather_data, timestamp) for city, weather_data in items]
+        self._enqueue(rows, len(rows), f"lote de {len(rows)} registros")
+
+    def save_forecast_snapshot(self, city: str, forecast: Dict):
+        """Enfileira a previsão (em colunas) para forecast_snapshots, com a hora atual como emissão"""
+        rows = _snapshot_rows(city, forecast, _utc_timestamp())
+        if rows:
+            self._enqueue(_ForecastSnapshot(rows), len(rows), f"previsão de '{city}'")
+
+    def _enqueue(self, item, count: int, description: str):
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += count
+            logger.warning("Fila de escrita cheia; %s descartado", description)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Aguarda a gravação de tudo que já foi enfileirado"""
+        if not self._writer_running():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        """Grava o que estiver pendente e encerra a thread de escrita"""
+        with self._writer_lock:
+            if self._writer_running():
+                self._queue.put(_STOP)
+                self._writer.join(timeout)
+            self._writer = None
+
+    def pending_writes(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending_writes": self.pending_writes(), "dropped": self.dropped}
+
+    def _writer_running(self) -> bool:
+        return (
+            self._writer is not None
+            and self._writer_pid == os.getpid()
+            and self._writer.is_alive()
+        )
+
+    def _ensure_writer(self):
+        if self._writer_running():
+            return
+        with self._writer_lock:
+            if self._writer_running():
+                return
+            if self._writer_pid != os.getpid():
+                # Threads não sobrevivem ao fork; a fila herdada pode estar inconsistente
+                self._queue = queue.Queue(maxsize=config.DB_QUEUE_MAX)
+            self._writer = threading.Thread(
+                target=self._write_loop, args=(self._queue,), name="weatherdb-writer", daemon=True
+            )
+            self._writer_pid = os.getpid()
+            self._writer.start()
+
+    def _write_loop(self, pending: "queue.Queue"):
+        conn = self._open_writer()
+        stop = False
+        while not stop:
+            batch = []
+            snapshots = []
+            waiters = []
+            item = pending.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stop = True
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                if isinstance(item, _ForecastSnapshot):
+                    snapshots.extend(item.rows)
+                elif isinstance(item, list):
+                    # Lote enfileirado de uma vez: nunca é dividido entre transações
+                    batch.extend(item)
+                else:
+                    batch.append(item)
+                if len(batch) + len(snapshots) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if batch:
+                try:
+                    with STAGE_LATENCY.time("db_write"):
+                        self._write_batch(conn, batch)
+                except Exception:
+                    logger.exception("Falha ao gravar lote de %d registros", len(batch))
+            if snapshots:
+                try:
+                    with STAGE_LATENCY.time("db_write"):
+                        self._write_snapshots(conn, snapshots)
+                except Exception:
+                    logger.exception("Falha ao gravar %d linhas de previsão", len(snapshots))
+            for waiter in waiters:
+                waiter.set()
+        if conn is not None:
+            conn.close()
+
+    def _open_writer(self):
+        """Conexão dedicada da thread de escrita, ou None se o backend grava pelo seu pool"""
+        raise NotImplementedError
+
+    def _write_batch(self, conn, rows: List[tuple]):
+        """Grava as linhas (formato de _history_row) em uma única transação"""
+        raise NotImplementedError
+
+    def _write_snapshots(self, conn, rows: List[tuple]):
+        """Grava as linhas de previsão (formato de _snapshot_rows) em uma única transação"""
+        raise NotImplementedError
+
+    def get_city_history(self, city: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                         limit: int = 50, cursor: Optional[str] = None) -> List[Dict]:
+        raise NotImplementedError
+
+    def as_of(self, city: str, at: datetime) -> Optional[Dict]:
+        """Valor da cidade no instante `at`.
+
+        A última leitura até `at` ou a previsão mais recente para o último horário
+        previsto até `at`, o que for mais recente; None se não houver nenhuma.
+        """
+        raise NotImplementedError
+
+    def aggregate_history(self, city: str, bucket_seconds: int, since: Optional[datetime] = None,
+                          until: Optional[datetime] = None) -> List[Dict]:
+        """min/max/média/contagem por intervalo.
+
+        Os intervalos inteiros do período são lidos do maior rollup compatível com
+        `bucket_seconds`; o histórico bruto só é lido nas pontas do período que não
+        caem no limite de um intervalo do rollup. Assim a série continua completa
+        depois que a retenção apaga as linhas brutas antigas, e só as pontas
+        parciais dependem delas.
+        """
+        rollup = rollup_for(bucket_seconds)
+        if rollup is None:
+            return merge_buckets(self._aggregate_raw(city, bucket_seconds, since, until))
+
+        seconds = ROLLUPS[rollup]
+        start = None if since is None else -(-_epoch(since) // seconds) * seconds
+        end = None if until is None else _epoch(until) // seconds * seconds
+        if start is not None and end is not None and start >= end:
+            # Período menor que um intervalo do rollup
+            return merge_buckets(self._aggregate_raw(city, bucket_seconds, since, until))
+
+        rows = list(self._aggregate_rollup(rollup, city, bucket_seconds, start, end))
+        if since is not None and start > _epoch(since):
+            rows += self._aggregate_raw(city, bucket_seconds, since, _from_epoch(start))
+        if until is not None and end < _epoch(until):
+            rows += self._aggregate_raw(city, bucket_seconds, _from_epoch(end), until)
+        return merge_buckets(rows)
+
+    def _aggregate_raw(self, city: str, bucket_seconds: int, since: Optional[datetime],
+                       until: Optional[datetime]) -> List:
+        """Linhas (bucket, count, <métrica>_min/_max/_sum) do histórico bruto em [since, until)"""
+        raise NotImplementedError
+
+    def _aggregate_rollup(self, rollup: str, city: str, bucket_seconds: int, start: Optional[int],
+                          end: Optional[int]) -> List:
+        """Linhas (bucket, count, <métrica>_min/_max/_sum) do rollup para intervalos em [start, end) (epoch)"""
+        raise NotImplementedError
+
+    def iter_history(self, cities: List[str], since: Optional[datetime] = None, until: Optional[datetime] = None,
+                     chunk_size: int = 5000) -> Iterator[List[tuple]]:
+        raise NotImplementedError
+
+    def apply_retention(self) -> Dict:
+        """Aplica a política de retenção (RETENTION_*) e devolve um relatório"""
+        raise NotImplementedError
+
+
+class WeatherDB(HistoryStore):
+    """Histórico de consultas em SQLite (modo WAL), o backend padrão.
+
+    Leituras usam uma conexão persistente por thread; escritas seguem o
+    HistoryStore, com os rollups atualizados na mesma transação de cada lote.
+    """
+
+    def __init__(self, db_path: str = "weather.db", batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None):
+        super().__init__(batch_size, flush_interval)
         self.db_path = db_path
+        self._local = threading.local()
         self.init_db()
-    
+
+    def _connect(self, new_database: bool = False) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        if new_database:
+            # Precisa vir antes da criação das tabelas e da troca para WAL
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        """Conexão persistente da thread atual (reaberta após fork)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._connect()
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
     def init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
+        # auto_vacuum só tem efeito em bancos novos; os existentes usam enable_incremental_vacuum()
+        conn = self._connect(new_database=True)
+        with conn:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS weather_history (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -21,29 +489,292 @@ class WeatherDB:
                     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
                 )
             """)
-    
-    def save_weather_data(self, city: str, weather_data: Dict):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                INSERT INTO weather_history 
-                (city, temperature, humidity, wind_speed, feels_like, description)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (
-                city.lower(),
-                weather_data['temperature'],
-                weather_data['humidity'],
-                weather_data['wind_speed'],
-                weather_data['feels_like'],
-                weather_data['description']
-            ))
-    
-    def get_city_history(self, city: str) -> List[Dict]:
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute("""
-                SELECT * FROM weather_history 
-                WHERE city = ? 
-                ORDER BY timestamp DESC 
-                LIMIT 50
-            """, (city.lower(),))
-            return [dict(row) for row in cursor.fetchall()]
\ No newline at end of file
+        self._migrate(conn)
+        conn.close()
+
+    def _migrate(self, conn: sqlite3.Connection):
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            conn.execute("BEGIN")
+            try:
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {number}")
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+
+    def close(self, timeout: Optional[float] = None):
+        super().close(timeout)
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _open_writer(self) -> sqlite3.Connection:
+        return self._connect()
+
+    def _write_batch(self, conn: sqlite3.Connection, rows: List[tuple]):
+        with conn:
+            self._insert_batch(conn, rows)
+
+    def _write_snapshots(self, conn: sqlite3.Connection, rows: List[tuple]):
+        with conn:
+            conn.executemany(INSERT_SNAPSHOT, rows)
+
+    def apply_retention(self) -> Dict:
+        from retention import run_retention
+        return run_retention(self)
+
+    def _insert_batch(self, conn: sqlite3.Connection, rows: List[tuple]):
+        """Grava as linhas e atualiza os rollups na mesma transação"""
+        conn.executemany(INSERT_WEATHER, rows)
+        for name, seconds in ROLLUPS.items():
+            conn.executemany(_rollup_upsert_sql(name), rollup_batch(rows, seconds))
+
+    def backfill_rollups(self) -> int:
+        """Reconstrói os rollups a partir do histórico bruto, uma cidade por transação.
+
+        Só os intervalos que começam depois da leitura bruta mais antiga são
+        refeitos: os anteriores resumem linhas já apagadas pela retenção e são
+        mantidos. O intervalo que contém a leitura mais antiga só é criado se
+        não existir.
+        """
+        self.flush()
+        conn = self._connect()
+        cities = [
+            (row[0], to_epoch(row[1]))
+            for row in conn.execute("SELECT city, MIN(timestamp) FROM weather_history GROUP BY city")
+        ]
+        for city, oldest in cities:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for name, seconds in ROLLUPS.items():
+                    first_complete = -(-oldest // seconds) * seconds
+                    conn.execute(
+                        f"DELETE FROM weather_rollup_{name} WHERE city = ? AND bucket >= ?", (city, first_complete)
+                    )
+                    conn.execute(_rollup_backfill_sql(name, "WHERE city = ?", keep_existing=True), (city,))
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+        conn.close()
+        return len(cities)
+
+    def enable_incremental_vacuum(self):
+        """Ativa auto_vacuum incremental em um banco existente (reescreve o arquivo)"""
+        self.flush()
+        conn = self._connect()
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        conn.close()
+
+    def get_city_history(self, city: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                         limit: int = 50, cursor: Optional[str] = None) -> List[Dict]:
+        """Histórico mais recente primeiro, com paginação por cursor (keyset)"""
+        conditions = ["city = ?"]
+        params: list = [city.lower()]
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(to_db_timestamp(since))
+        if until is not None:
+            conditions.append("timestamp <= ?")
+            params.append(to_db_timestamp(until))
+        if cursor is not None:
+            conditions.append("(timestamp, id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+        params.append(limit)
+
+        rows = self._conn().execute(f"""
+            SELECT * FROM weather_history
+            WHERE {" AND ".join(conditions)}
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        """, params)
+        return [dict(row) for row in rows.fetchall()]
+
+    def as_of(self, city: str, at: datetime) -> Optional[Dict]:
+        # Cada consulta é uma busca descendente em um índice: (city, timestamp) e a chave primária
+        timestamp = to_db_timestamp(at)
+        conn = self._conn()
+        observed = conn.execute("""
+            SELECT timestamp, temperature, feels_like, humidity, wind_speed, description
+            FROM weather_history
+            WHERE city = ? AND timestamp <= ?
+            ORDER BY timestamp DESC, id DESC
+            LIMIT 1
+        """, (city.lower(), timestamp)).fetchone()
+        forecast = conn.execute("""
+            SELECT target_time AS timestamp, temperature, feels_like, humidity, wind_speed, description, issued_at
+            FROM forecast_snapshots
+            WHERE city = ? AND target_time <= ?
+            ORDER BY target_time DESC, issued_at DESC
+            LIMIT 1
+        """, (city.lower(), timestamp)).fetchone()
+        return as_of_result(city, dict(observed) if observed else None, dict(forecast) if forecast else None)
+
+    def iter_history(self, cities: List[str], since: Optional[datetime] = None, until: Optional[datetime] = None,
+                     chunk_size: int = 5000) -> Iterator[List[tuple]]:
+        """Histórico completo das cidades em blocos de até `chunk_size` linhas (EXPORT_COLUMNS).
+
+        Cada bloco é uma consulta keyset própria pelo índice (city, timestamp), então
+        a memória fica limitada a um bloco e nenhuma transação de leitura fica aberta
+        entre blocos, o que permitiria ao WAL crescer durante exportações longas.
+        """
+        for city in cities:
+            conditions = ["city = ?"]
+            params: list = [city.lower()]
+            if since is not None:
+                conditions.append("timestamp >= ?")
+                params.append(to_db_timestamp(since))
+            if until is not None:
+                conditions.append("timestamp <= ?")
+                params.append(to_db_timestamp(until))
+            query = f"""
+                SELECT {", ".join(EXPORT_COLUMNS)} FROM weather_history
+                WHERE {" AND ".join(conditions)} AND (timestamp, id) > (?, ?)
+                ORDER BY timestamp, id
+                LIMIT ?
+            """
+            last = ("", 0)
+            while True:
+                # Conexão buscada a cada bloco: o consumidor pode trocar de thread entre blocos
+                rows = self._conn().execute(query, (*params, *last, chunk_size)).fetchall()
+                if not rows:
+                    break
+                yield [tuple(row) for row in rows]
+                if len(rows) < chunk_size:
+                    break
+                last = (rows[-1]["timestamp"], rows[-1]["id"])
+
+    def _aggregate_raw(self, city: str, bucket_seconds: int, since: Optional[datetime],
+                       until: Optional[datetime]) -> List:
+        conditions = ["city = ?"]
+        params: list = [bucket_seconds, bucket_seconds, city.lower()]
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(to_db_timestamp(since))
+        if until is not None:
+            conditions.append("timestamp < ?")
+            params.append(to_db_timestamp(until))
+        columns = ", ".join(
+            f"MIN({metric}) AS {metric}_min, MAX({metric}) AS {metric}_max, SUM({metric}) AS {metric}_sum"
+            for metric in METRICS
+        )
+
+        return self._conn().execute(f"""
+            SELECT (CAST(strftime('%s', timestamp) AS INTEGER) / ?) * ? AS bucket,
+                   COUNT(*) AS count, {columns}
+            FROM weather_history
+            WHERE {" AND ".join(conditions)}
+            GROUP BY bucket
+        """, params).fetchall()
+
+    def _aggregate_rollup(self, rollup: str, city: str, bucket_seconds: int, start: Optional[int],
+                          end: Optional[int]) -> List:
+        conditions = ["city = ?"]
+        params: list = [bucket_seconds, bucket_seconds, city.lower()]
+        if start is not None:
+            conditions.append("bucket >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("bucket < ?")
+            params.append(end)
+        columns = ", ".join(
+            f"MIN({metric}_min) AS {metric}_min, MAX({metric}_max) AS {metric}_max, "
+            f"SUM({metric}_sum) AS {metric}_sum"
+            for metric in METRICS
+        )
+
+        return self._conn().execute(f"""
+            SELECT (bucket / ?) * ? AS bucket, SUM(count) AS count, {columns}
+            FROM weather_rollup_{rollup}
+            WHERE {" AND ".join(conditions)}
+            GROUP BY 1
+        """, params).fetchall()
+
+
+def create_history_store() -> HistoryStore:
+    """Backend do histórico escolhido por HISTORY_BACKEND ("sqlite" ou "postgres")"""
+    if config.HISTORY_BACKEND == "sqlite":
+        return WeatherDB()
+    if config.HISTORY_BACKEND == "postgres":
+        if not config.DATABASE_URL:
+            raise ValueError("HISTORY_BACKEND=postgres requer DATABASE_URL")
+        from postgres_db import PostgresDB
+        return PostgresDB(config.DATABASE_URL)
+    raise ValueError(f"HISTORY_BACKEND inválido: '{config.HISTORY_BACKEND}'. Use 'sqlite' ou 'postgres'")
+
+
+def rollup_for(bucket_seconds: int) -> Optional[str]:
+    """Maior rollup cujos intervalos cabem um número inteiro de vezes em `bucket_seconds`"""
+    for name, seconds in sorted(ROLLUPS.items(), key=lambda item: -item[1]):
+        if bucket_seconds % seconds == 0:
+            return name
+    return None
+
+
+def _epoch(value: datetime) -> int:
+    return to_epoch(to_db_timestamp(value))
+
+
+def _from_epoch(value: int) -> datetime:
+    return datetime.fromtimestamp(value, timezone.utc)
+
+
+def merge_buckets(rows) -> List[Dict]:
+    """Junta por intervalo as linhas com bucket (epoch), count e <métrica>_min/_max/_sum.
+
+    Um intervalo pode vir de mais de uma consulta (rollup e pontas do histórico
+    bruto); a média é calculada depois da junção.
+    """
+    merged: Dict[int, Dict] = {}
+    for row in rows:
+        current = merged.get(row["bucket"])
+        if current is None:
+            merged[row["bucket"]] = {key: row[key] for key in rollup_columns()[1:]}
+            continue
+        current["count"] += row["count"]
+        for metric in METRICS:
+            current[f"{metric}_sum"] += row[f"{metric}_sum"]
+            current[f"{metric}_min"] = min(current[f"{metric}_min"], row[f"{metric}_min"])
+            current[f"{metric}_max"] = max(current[f"{metric}_max"], row[f"{metric}_max"])
+
+    buckets = []
+    for epoch in sorted(merged):
+        row = merged[epoch]
+        bucket = {
+            "bucket": _from_epoch(epoch).strftime(TIMESTAMP_FORMAT),
+            "count": row["count"],
+        }
+        for metric in METRICS:
+            bucket[metric] = {
+                "min": row[f"{metric}_min"],
+                "max": row[f"{metric}_max"],
+                "mean": round(row[f"{metric}_sum"] / row["count"], 2),
+            }
+        buckets.append(bucket)
+    return buckets
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manutenção do banco de histórico do WeatherViz")
+    parser.add_argument("--db", default="weather.db", help="caminho do arquivo SQLite")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("backfill-rollups", help="reconstrói os rollups horários e diários")
+    commands.add_parser("compact", help="aplica a política de retenção e libera espaço")
+    commands.add_parser("enable-incremental-vacuum", help="ativa auto_vacuum incremental (executa VACUUM)")
+    args = parser.parse_args()
+
+    database = WeatherDB(args.db)
+    if args.command == "backfill-rollups":
+        print(f"Rollups reconstruídos para {database.backfill_rollups()} cidades")
+    elif args.command == "compact":
+        print(database.apply_retention())
+    elif args.command == "enable-incremental-vacuum":
+        database.enable_incremental_vacuum()
+        print("auto_vacuum incremental ativado")
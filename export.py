@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+from typing import Iterable, Iterator, List
+
+from database import EXPORT_COLUMNS
+
+try:
+    import pyarrow as pa
+except ImportError:  # Exportação Arrow é opcional
+    pa = None
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def ndjson_stream(chunks: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """Um objeto JSON por linha"""
+    for rows in chunks:
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows
+        ).encode()
+
+
+def csv_stream(chunks: Iterable[List[tuple]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Só o cabeçalho, quando não há histórico
+        yield buffer.getvalue().encode()
+
+
+def _arrow_schema():
+    return pa.schema([
+        ("id", pa.int64()),
+        ("city", pa.string()),
+        ("timestamp", pa.timestamp("s", tz="UTC")),
+        ("temperature", pa.float64()),
+        ("feels_like", pa.float64()),
+        ("humidity", pa.int64()),
+        ("wind_speed", pa.float64()),
+        ("description", pa.string()),
+    ])
+
+
+def arrow_stream(chunks: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """Formato de streaming IPC do Apache Arrow, um record batch por bloco"""
+    schema = _arrow_schema()
+    buffer = io.BytesIO()
+    with pa.ipc.new_stream(buffer, schema) as writer:
+        for rows in chunks:
+            columns = [list(column) for column in zip(*rows)]
+            # Gravados em UTC sem fuso: lidos como horário ingênuo e marcados como UTC
+            columns[2] = pa.array(columns[2]).cast(pa.timestamp("s")).cast(schema.field("timestamp").type)
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    # Schema (se não houve blocos) e marcador de fim de stream
+    yield buffer.getvalue()
+
+
+FORMATS = {"ndjson": ndjson_stream, "csv": csv_stream, "arrow": arrow_stream}
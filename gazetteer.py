@@ -0,0 +1,112 @@
+import bisect
+import gzip
+import json
+import re
+import unicodedata
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def fold(text: str) -> str:
+    """Chave de busca: sem acentos, sem pontuação, minúscula e com espaços normalizados"""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(_PUNCTUATION.sub(" ", text.casefold()).split())
+
+
+def _trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+def split_query(query: str) -> Tuple[str, Optional[str]]:
+    """Separa 'Cidade[,estado][,PAÍS]' em (nome, código do país)"""
+    parts = [part.strip() for part in query.split(",")]
+    country = parts[-1].upper() if len(parts) > 1 and len(parts[-1]) == 2 else None
+    return parts[0], country
+
+
+class CityIndex:
+    """Índice local de cidades do OpenWeatherMap (city.list.json).
+
+    Resolve nomes para IDs sem ir ao OpenWeatherMap: busca exata por chave sem
+    acentos, prefixo (autocomplete) por busca binária nas chaves ordenadas e
+    sugestões aproximadas por trigramas.
+    """
+
+    def __init__(self, cities: Iterable[Dict]):
+        # Entradas compactas: (id, nome, país, estado)
+        self._entries: List[Tuple[int, str, str, str]] = []
+        by_key: Dict[str, List[int]] = {}
+        for city in cities:
+            key = fold(city["name"])
+            if not key:
+                continue
+            by_key.setdefault(key, []).append(len(self._entries))
+            self._entries.append((city["id"], city["name"], city.get("country", ""), city.get("state", "")))
+
+        self._keys = sorted(by_key)
+        self._by_key = by_key
+        self._trigram_index: Dict[str, array] = {}
+        for position, key in enumerate(self._keys):
+            for trigram in _trigrams(key):
+                self._trigram_index.setdefault(trigram, array("I")).append(position)
+
+    @classmethod
+    def load(cls, path: str) -> "CityIndex":
+        """Carrega o dump city.list.json (ou .json.gz) do OpenWeatherMap"""
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as file:
+            return cls(json.load(file))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, query: str) -> List[Dict]:
+        """Cidades com nome exatamente igual (sem acentos/caixa), filtradas pelo país se informado"""
+        name, country = split_query(query)
+        matches = [self._entries[index] for index in self._by_key.get(fold(name), ())]
+        if country:
+            matches = [entry for entry in matches if entry[2] == country]
+        return [_as_dict(entry) for entry in matches]
+
+    def autocomplete(self, prefix: str, limit: int = 10) -> List[Dict]:
+        name, country = split_query(prefix)
+        key = fold(name)
+        if not key:
+            return []
+        results = []
+        position = bisect.bisect_left(self._keys, key)
+        while position < len(self._keys) and self._keys[position].startswith(key) and len(results) < limit:
+            for index in self._by_key[self._keys[position]]:
+                entry = self._entries[index]
+                if not country or entry[2] == country:
+                    results.append(_as_dict(entry))
+            position += 1
+        return results[:limit]
+
+    def suggest(self, query: str, limit: int = 5, min_score: float = 0.4) -> List[Dict]:
+        """Nomes parecidos por similaridade de trigramas (Jaccard), para erros de digitação"""
+        key = fold(split_query(query)[0])
+        if not key:
+            return []
+        grams = _trigrams(key)
+        hits = Counter()
+        for trigram in grams:
+            hits.update(self._trigram_index.get(trigram, ()))
+        scored = []
+        for position, shared in hits.most_common(limit * 20):
+            candidate = self._keys[position]
+            score = shared / (len(grams) + len(_trigrams(candidate)) - shared)
+            if score >= min_score:
+                scored.append((score, candidate))
+        scored.sort(key=lambda item: -item[0])
+        return [_as_dict(self._entries[self._by_key[candidate][0]]) for _, candidate in scored[:limit]]
+
+
+def _as_dict(entry: Tuple[int, str, str, str]) -> Dict:
+    city_id, name, country, state = entry
+    return {"id": city_id, "name": name, "country": country, "state": state}
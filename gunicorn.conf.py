@@ -0,0 +1,47 @@
+"""
+Modo de produção com vários workers:
+
+    gunicorn -c gunicorn.conf.py main:app
+
+O app é carregado uma vez no processo mestre (preload_app) e os workers são
+criados por fork, compartilhando por copy-on-write o que é só leitura (índice
+de cidades, configuração, módulos). Conexões com o banco e o pool HTTP do
+OpenWeatherMap são abertos depois do fork, em cada worker.
+"""
+import gc
+import os
+
+# Sem WEB_CONCURRENCY: dois por núcleo, até 8. O limite evita que um host com
+# muitos núcleos divida a cota do OpenWeatherMap em partes pequenas demais
+MAX_DEFAULT_WORKERS = 8
+workers = int(os.getenv("WEB_CONCURRENCY") or min(2 * (os.cpu_count() or 1), MAX_DEFAULT_WORKERS))
+
+# Variáveis lidas por config.py (importado a seguir). As cotas do OpenWeatherMap
+# são divididas entre os workers
+os.environ["WEATHERVIZ_WORKERS"] = str(workers)
+# O cache de cada worker é gravado aqui e recarregado no próximo início
+os.environ.setdefault("CACHE_SNAPSHOT_PATH", "cache_snapshot.json")
+# Só o worker que detém esta trava roda pré-busca e retenção
+os.environ.setdefault("BACKGROUND_LOCK_PATH", "background.lock")
+
+from config import GRACEFUL_TIMEOUT  # noqa: E402
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "server.WeatherVizWorker"
+preload_app = True
+
+# Os workers esperam as requisições em andamento por GRACEFUL_TIMEOUT; a folga
+# cobre o shutdown da aplicação (snapshot do cache e fila de escrita do histórico)
+graceful_timeout = int(GRACEFUL_TIMEOUT) + 10
+accesslog = "-"
+
+
+def when_ready(server):
+    from main import db
+
+    # O mestre não atende requisições: libera a conexão do SQLite / o pool do
+    # PostgreSQL abertos na carga do app, para não serem herdados pelos workers
+    db.close()
+    # Objetos carregados até aqui nunca são coletados; o coletor não toca nas
+    # páginas deles e elas seguem compartilhadas entre os workers
+    gc.freeze()
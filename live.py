@@ -0,0 +1,216 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import orjson
+from fastapi.middleware.gzip import GZipMiddleware
+
+import config
+from cache import normalize_city
+from database import HistoryStore
+from ratelimit import PREFETCH
+from weather_service import AsyncWeatherService
+
+logger = logging.getLogger(__name__)
+
+LIVE_PATH = "/live"
+
+# (cidade normalizada, unidades, idioma)
+Topic = Tuple[str, str, str]
+
+KEEPALIVE_EVENT = b": keepalive\n\n"
+
+
+class Subscription:
+    """Fila de eventos de uma conexão.
+
+    Guarda só o último evento de cada cidade: um cliente lento recebe a leitura
+    mais recente quando voltar a consumir, em vez de acumular leituras antigas.
+    """
+
+    def __init__(self, topics: List[Topic]):
+        self.topics = topics
+        self._pending: Dict[Topic, bytes] = {}
+        self._ready = asyncio.Event()
+        self.closed = False
+
+    def push(self, topic: Topic, event: bytes):
+        self._pending[topic] = event
+        self._ready.set()
+
+    def close(self):
+        """Encerra o stream depois de entregar os eventos pendentes"""
+        self.closed = True
+        self._ready.set()
+
+    async def events(self, keepalive: float) -> AsyncIterator[bytes]:
+        """Eventos pendentes agrupados em um único envio, com comentário de keepalive quando ocioso"""
+        while True:
+            try:
+                await asyncio.wait_for(self._ready.wait(), keepalive)
+            except asyncio.TimeoutError:
+                yield KEEPALIVE_EVENT
+                continue
+            self._ready.clear()
+            pending, self._pending = self._pending, {}
+            if pending:
+                yield b"".join(pending.values())
+            if self.closed:
+                return
+
+
+class LiveHub:
+    """Distribui o clima atual das cidades assinadas por Server-Sent Events.
+
+    Cada cidade é consultada uma vez por `interval`, em lote e pelo cache do
+    serviço, não importa quantas conexões a assinem. O evento é serializado uma
+    vez por mudança e entregue a todos os assinantes; leituras iguais à anterior
+    não são reenviadas.
+    """
+
+    def __init__(self, service: AsyncWeatherService, db: Optional[HistoryStore] = None,
+                 interval: Optional[float] = None, max_subscribers: Optional[int] = None):
+        self.service = service
+        self.db = db
+        self.interval = interval or config.LIVE_REFRESH_INTERVAL
+        self.max_subscribers = max_subscribers or config.LIVE_MAX_SUBSCRIBERS
+        self._subscribers: Dict[Topic, Set[Subscription]] = {}
+        self._names: Dict[Topic, str] = {}
+        self._readings: Dict[Topic, Dict] = {}
+        self._events: Dict[Topic, bytes] = {}
+        self._new_topics: Set[Topic] = set()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.connections = 0
+        self.event_id = 0
+        self.refreshes = 0
+        self.events_sent = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def subscribe(self, cities: List[str], units: str, lang: str) -> Subscription:
+        if self.connections >= self.max_subscribers:
+            raise OverflowError("Limite de conexões ao vivo atingido. Tente novamente mais tarde")
+        names: Dict[Topic, str] = {}
+        for city in cities:
+            names.setdefault((normalize_city(city), units, lang), city)
+        subscription = Subscription(list(names))
+        for topic, city in names.items():
+            subscribers = self._subscribers.setdefault(topic, set())
+            subscribers.add(subscription)
+            self._names.setdefault(topic, city)
+            event = self._events.get(topic)
+            if event is not None:
+                # Última leitura conhecida, sem esperar a próxima atualização
+                subscription.push(topic, event)
+            elif len(subscribers) == 1:
+                self._new_topics.add(topic)
+                self._wake.set()
+        self.connections += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for topic in subscription.topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscription)
+            if not subscribers:
+                # Ninguém mais assina: para de consultar a cidade
+                for mapping in (self._subscribers, self._names, self._readings, self._events):
+                    mapping.pop(topic, None)
+        self.connections -= 1
+
+    def close(self):
+        """Encerra todos os streams abertos (os clientes reconectam a outro worker)"""
+        for subscription in {item for subscribers in self._subscribers.values() for item in subscribers}:
+            subscription.close()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_refresh = loop.time()
+        while True:
+            timeout = max(0.0, next_refresh - loop.time())
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if loop.time() >= next_refresh:
+                self._new_topics.clear()
+                topics = list(self._subscribers)
+                next_refresh = loop.time() + self.interval
+                self.refreshes += 1
+            else:
+                # Cidades assinadas agora: busca já, sem esperar a próxima passada
+                topics, self._new_topics = list(self._new_topics), set()
+            try:
+                await self._refresh(topics)
+            except Exception:
+                logger.warning("Falha ao atualizar assinaturas ao vivo", exc_info=True)
+
+    async def _refresh(self, topics: List[Topic]):
+        groups: Dict[Tuple[str, str], List[Topic]] = {}
+        for topic in topics:
+            groups.setdefault(topic[1:], []).append(topic)
+        changed = []
+        for (units, lang), group in groups.items():
+            names = [self._names.get(topic, topic[0]) for topic in group]
+            results = await self.service.get_weather_batch(
+                names, units, lang, priority=PREFETCH, timeout=config.BATCH_TIMEOUT
+            )
+            for topic, name, reading in zip(group, names, results):
+                if topic not in self._subscribers or self._readings.get(topic) == reading:
+                    continue
+                self._readings[topic] = reading
+                self._publish(topic, reading)
+                if "error" not in reading:
+                    changed.append((name, reading))
+        if self.db is not None and changed:
+            self.db.save_weather_batch(changed)
+
+    def _publish(self, topic: Topic, reading: Dict):
+        self.event_id += 1
+        name = "error" if "error" in reading else "weather"
+        data = orjson.dumps({"query": topic[0], "units": topic[1], "lang": topic[2], **reading})
+        event = b"id: %d\nevent: %s\ndata: %s\n\n" % (self.event_id, name.encode(), data)
+        self._events[topic] = event
+        subscribers = self._subscribers[topic]
+        for subscription in subscribers:
+            subscription.push(topic, event)
+        self.events_sent += len(subscribers)
+
+    def stats(self) -> Dict:
+        return {
+            "connections": self.connections,
+            "cities": len(self._subscribers),
+            "interval": self.interval,
+            "refreshes": self.refreshes,
+            "events_sent": self.events_sent,
+            "running": self._task is not None and not self._task.done(),
+        }
+
+
+class GZipExceptLive(GZipMiddleware):
+    """GZipMiddleware que deixa o stream de eventos passar sem compressão.
+
+    O compressor retém a saída até juntar um bloco, o que atrasaria os eventos
+    indefinidamente.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == LIVE_PATH:
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
@@ -1,12 +1,30 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import logging
+from datetime import datetime, timezone
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from typing import Dict, List, Optional
 from fastapi import Query
 import uvicorn
 
-from weather_service import WeatherService
-from database import WeatherDB
-from models import WeatherResponse, WeatherHistory, ErrorResponse, ForecastResponse
+import config
+from conditional import conditional_json
+from weather_service import AsyncWeatherService
+from database import create_history_store, encode_cursor, parse_bucket
+from downsample import lttb_indices
+import export
+from gazetteer import CityIndex
+from live import LIVE_PATH, GZipExceptLive, LiveHub
+from circuit import CLOSED, HALF_OPEN, OPEN, UpstreamUnavailable
+from metrics import REGISTRY, CallbackGauge, MetricsMiddleware, numeric_stats
+from ratelimit import COMPARE, RateLimitExceeded
+from scheduler import PrefetchScheduler, load_watchlist
+from background import BackgroundLock
+from models import (
+    WeatherResponse, WeatherHistory, WeatherAsOf, ErrorResponse, ForecastResponse, HistoryAggregate, BatchWeatherRequest
+)
 
 app = FastAPI(
     title="WeatherViz API",
@@ -21,72 +39,363 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+# Comprime respostas acima do limite (históricos, previsões, exportações), exceto o stream ao vivo
+app.add_middleware(GZipExceptLive, minimum_size=config.GZIP_MIN_SIZE)
+
+# Contagem e latência por rota; por fora dos demais, para medir a requisição inteira
+if config.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+logger = logging.getLogger(__name__)
+
 # Inicializar serviços
-weather_service = WeatherService()
-db = WeatherDB()
+city_index = CityIndex.load(config.CITY_LIST_PATH) if config.CITY_LIST_PATH else None
+db = create_history_store()
+
+def save_forecast_snapshot(city: str, units: str, forecast: Dict):
+    # Só previsões em unidades métricas, para que os valores guardados sejam comparáveis
+    if units == "metric":
+        db.save_forecast_snapshot(city, forecast)
+
+weather_service = AsyncWeatherService(city_index=city_index, on_forecast=save_forecast_snapshot)
+prefetcher = PrefetchScheduler(weather_service, db, load_watchlist())
+live_hub = LiveHub(weather_service, db)
+background_tasks = set()
+background_lock = BackgroundLock(config.BACKGROUND_LOCK_PATH) if config.BACKGROUND_LOCK_PATH else None
+
+# Estado dos componentes, lido a cada coleta de /metrics
+for name, documentation, callback, labelname in (
+    ("weatherviz_cache", "Cache de respostas (contadores e tamanho)",
+     lambda: numeric_stats(weather_service.cache.stats()), "stat"),
+    ("weatherviz_negative_cache", "Cache negativo de cidades inexistentes",
+     lambda: numeric_stats(weather_service.negative_cache.stats()), "stat"),
+    ("weatherviz_singleflight", "Chamadas coalescidas e em andamento ao OpenWeatherMap",
+     lambda: numeric_stats(weather_service.flight.stats()), "stat"),
+    ("weatherviz_rate_limit", "Limitador de chamadas ao OpenWeatherMap",
+     lambda: numeric_stats(weather_service.limiter.stats()), "stat"),
+    ("weatherviz_rate_limit_queued", "Chamadas aguardando ficha do limitador por prioridade",
+     lambda: weather_service.limiter.stats()["queued"], "priority"),
+    ("weatherviz_circuit_state", "Estado do disjuntor do OpenWeatherMap (1 no estado atual)",
+     lambda: {state: int(weather_service.breaker.state == state) for state in (CLOSED, HALF_OPEN, OPEN)}, "state"),
+    ("weatherviz_circuit", "Falhas consecutivas e chamadas recusadas pelo disjuntor",
+     lambda: numeric_stats(weather_service.breaker.stats()), "stat"),
+    ("weatherviz_live", "Conexões, cidades assinadas e eventos enviados ao vivo",
+     lambda: numeric_stats(live_hub.stats()), "stat"),
+    ("weatherviz_history_store", "Fila de escrita e pool de conexões do histórico",
+     lambda: numeric_stats(db.stats()), "stat"),
+):
+    REGISTRY.register(CallbackGauge(name, documentation, callback, labelname))
+
+async def retention_loop():
+    """Aplica a política de retenção do histórico periodicamente"""
+    while True:
+        await asyncio.sleep(config.RETENTION_INTERVAL)
+        try:
+            await run_in_threadpool(db.apply_retention)
+        except Exception:
+            logger.exception("Falha ao aplicar retenção do histórico")
+
+async def background_jobs():
+    """Pré-busca e retenção, em um único worker: os demais esperam a trava para assumir se ele sair"""
+    while background_lock is not None and not background_lock.acquire():
+        await asyncio.sleep(config.BACKGROUND_LOCK_RETRY)
+    weather_service.reserve_prefetch_quota()
+    if config.RETENTION_INTERVAL > 0:
+        background_tasks.add(asyncio.create_task(retention_loop()))
+    prefetcher.start()
+
+async def snapshot_loop():
+    """Persiste o cache periodicamente, para que um reinício não comece com o cache frio"""
+    while True:
+        await asyncio.sleep(config.CACHE_SNAPSHOT_INTERVAL)
+        try:
+            await weather_service.save_snapshot(config.CACHE_SNAPSHOT_PATH)
+        except Exception:
+            logger.exception("Falha ao gravar snapshot do cache")
+
+# Chamados pelo servidor (server.DrainingServer) ao receber SIGTERM, antes de esperar
+# as requisições em andamento: streams ao vivo não terminam sozinhos
+app.state.drain_callbacks = [live_hub.close]
+
+@app.on_event("startup")
+async def startup():
+    await weather_service.start()
+    if config.CACHE_SNAPSHOT_PATH:
+        try:
+            restored = await weather_service.load_snapshot(config.CACHE_SNAPSHOT_PATH)
+            logger.info("Cache aquecido com %d entradas de %s", restored, config.CACHE_SNAPSHOT_PATH)
+        except Exception:
+            logger.exception("Falha ao carregar snapshot do cache")
+        if config.CACHE_SNAPSHOT_INTERVAL > 0:
+            background_tasks.add(asyncio.create_task(snapshot_loop()))
+    background_tasks.add(asyncio.create_task(background_jobs()))
+    live_hub.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in background_tasks:
+        task.cancel()
+    await prefetcher.stop()
+    if background_lock is not None:
+        background_lock.release()
+    await live_hub.stop()
+    if config.CACHE_SNAPSHOT_PATH:
+        try:
+            await weather_service.save_snapshot(config.CACHE_SNAPSHOT_PATH)
+        except Exception:
+            logger.exception("Falha ao gravar snapshot do cache")
+    await weather_service.close()
+    # Grava o histórico pendente antes de encerrar
+    await run_in_threadpool(db.close)
 
 @app.get("/")
 def root():
     return {"message": "WeatherViz API - Sistema de consulta climática"}
 
 @app.get("/weather/{city}", response_model=WeatherResponse)
-def get_weather(city: str, units: str = "metric", lang: str = "pt_br"):
+async def get_weather(request: Request, city: str, units: str = "metric", lang: str = "pt_br"):
     try:
-        weather_data = weather_service.get_weather(city, units, lang)
+        weather_data = await weather_service.get_weather(city, units, lang)
         
-        # Salvar no banco
+        # Salvar no banco (enfileirado, gravado em lote fora da requisição)
         db.save_weather_data(city, weather_data)
         
-        return weather_data
+        return conditional_json(request, weather_data, f"max-age={int(config.WEATHER_CACHE_TTL)}")
     
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except UpstreamUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
+    except Exception:
+        logger.exception("Erro ao consultar clima de %s", city)
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.get("/history/{city}", response_model=List[WeatherHistory])
-def get_history(city: str):
+def get_history(
+    request: Request,
+    city: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(50, ge=1, le=1000),
+    cursor: Optional[str] = None,
+):
+    """Histórico paginado. A próxima página é indicada no header X-Next-Cursor"""
+    try:
+        history = db.get_city_history(city, since, until, limit, cursor)
+        headers = {}
+        if len(history) == limit:
+            headers["X-Next-Cursor"] = encode_cursor(history[-1])
+        # Muda a cada leitura gravada: o cliente sempre revalida, e recebe 304 se nada mudou
+        return conditional_json(request, history, "no-cache", headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        logger.exception("Erro ao consultar histórico de %s", city)
+        raise HTTPException(status_code=500, detail="Erro ao consultar histórico")
+
+@app.get("/history/{city}/aggregate", response_model=HistoryAggregate)
+def get_history_aggregate(
+    request: Request,
+    city: str,
+    bucket: str = "1h",
+    since: Optional[datetime] = Query(None, alias="from"),
+    until: Optional[datetime] = Query(None, alias="to"),
+    points: Optional[int] = Query(None, ge=3, le=5000),
+):
+    """Agregados por intervalo para gráficos. Ex: /history/São Paulo/aggregate?bucket=1h&points=200"""
+    try:
+        bucket_seconds = parse_bucket(bucket)
+        buckets = db.aggregate_history(city, bucket_seconds, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        logger.exception("Erro ao agregar histórico de %s", city)
+        raise HTTPException(status_code=500, detail="Erro ao consultar histórico")
+    
+    # Reduz a série a `points` intervalos preservando picos e vales da temperatura média
+    if points and len(buckets) > points:
+        xs = [datetime.fromisoformat(item["bucket"]).timestamp() for item in buckets]
+        ys = [item["temperature"]["mean"] for item in buckets]
+        buckets = [buckets[index] for index in lttb_indices(xs, ys, points)]
+    
+    return conditional_json(
+        request, {"city": city, "bucket_seconds": bucket_seconds, "buckets": buckets}, "no-cache"
+    )
+
+@app.get("/history/{city}/at", response_model=WeatherAsOf)
+def get_history_as_of(request: Request, city: str, time: Optional[datetime] = None):
+    """Valor da cidade em um instante: a última leitura ou previsão até `time` (padrão: agora)"""
     try:
-        history = db.get_city_history(city)
-        return history
-    except Exception as e:
+        value = db.as_of(city, time or datetime.now(timezone.utc))
+    except Exception:
+        logger.exception("Erro ao consultar %s em %s", city, time)
         raise HTTPException(status_code=500, detail="Erro ao consultar histórico")
+    if value is None:
+        raise HTTPException(status_code=404, detail=f"Sem leituras ou previsões de '{city}' até esse instante")
+    return conditional_json(request, value, "no-cache")
+
+@app.get("/export")
+def export_history(
+    cities: str,
+    since: Optional[datetime] = Query(None, alias="from"),
+    until: Optional[datetime] = Query(None, alias="to"),
+    format: str = "ndjson",
+):
+    """Exporta o histórico completo em streaming. Ex: /export?cities=São Paulo,Recife&format=csv"""
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail="Formato inválido. Use 'ndjson', 'csv' ou 'arrow'")
+    if format == "arrow" and export.pa is None:
+        raise HTTPException(status_code=501, detail="Exportação Arrow requer o pacote pyarrow")
+    city_list = [city.strip() for city in cities.split(',') if city.strip()]
+    if not city_list:
+        raise HTTPException(status_code=400, detail="Informe ao menos uma cidade")
+    
+    # Blocos lidos do banco sob demanda, conforme o cliente consome a resposta
+    chunks = db.iter_history(city_list, since, until, config.EXPORT_CHUNK_SIZE)
+    return StreamingResponse(
+        export.FORMATS[format](chunks),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="historico.{format}"'},
+    )
+
+FORECAST_FORMATS = ("rows", "columnar")
 
 @app.get("/forecast/{city}", response_model=ForecastResponse)
-def get_forecast(city: str, units: str = "metric", lang: str = "pt_br"):
+async def get_forecast(request: Request, city: str, units: str = "metric", lang: str = "pt_br",
+                       format: str = "rows"):
+    """Previsão de 5 dias. Com format=columnar, devolve uma lista por campo em vez de uma por previsão"""
+    if format not in FORECAST_FORMATS:
+        raise HTTPException(status_code=400, detail="Formato inválido. Use 'rows' ou 'columnar'")
+    
     try:
-        forecast_data = weather_service.get_forecast(city, units, lang)
-        return forecast_data
+        forecast_data = await weather_service.get_forecast(city, units, lang, columnar=format == "columnar")
+        return conditional_json(request, forecast_data, f"max-age={int(config.FORECAST_CACHE_TTL)}")
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except UpstreamUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
+    except Exception:
+        logger.exception("Erro ao consultar previsão de %s", city)
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.get("/compare")
-def compare_cities(cities: str, units: str = "metric", lang: str = "pt_br"):
+async def compare_cities(cities: str, units: str = "metric", lang: str = "pt_br"):
     """Compara múltiplas cidades. Ex: /compare?cities=São Paulo,Rio de Janeiro,Brasília"""
+    city_list = [city.strip() for city in cities.split(',') if city.strip()]
+    if len(city_list) > config.MAX_COMPARE_CITIES:
+        raise HTTPException(
+            status_code=400, detail=f"Máximo {config.MAX_COMPARE_CITIES} cidades por comparação"
+        )
+    
     try:
-        city_list = [city.strip() for city in cities.split(',')]
-        if len(city_list) > 5:
-            raise HTTPException(status_code=400, detail="Máximo 5 cidades por comparação")
-        
-        results = []
-        for city in city_list:
-            try:
-                weather_data = weather_service.get_weather(city, units, lang)
-                results.append(weather_data)
-            except:
-                results.append({"city": city, "error": "Cidade não encontrada"})
-        
+        results = await weather_service.get_weather_batch(
+            city_list, units, lang, priority=COMPARE, timeout=config.COMPARE_CITY_TIMEOUT
+        )
         return {"comparison": results}
-    except Exception as e:
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        logger.exception("Erro ao comparar cidades %s", city_list)
         raise HTTPException(status_code=500, detail="Erro ao comparar cidades")
 
+@app.post("/weather/batch")
+async def get_weather_batch(request: BatchWeatherRequest):
+    """Clima atual de várias cidades usando o endpoint em lote do OpenWeatherMap"""
+    cities = [city.strip() for city in request.cities if city.strip()]
+    if len(cities) > config.MAX_BATCH_CITIES:
+        raise HTTPException(
+            status_code=400, detail=f"Máximo {config.MAX_BATCH_CITIES} cidades por requisição"
+        )
+    
+    try:
+        results = await weather_service.get_weather_batch(
+            cities, request.units, request.lang, priority=COMPARE, timeout=config.BATCH_TIMEOUT
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        logger.exception("Erro na consulta em lote de %d cidades", len(cities))
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+    
+    # Histórico de todas as cidades em uma única transação
+    db.save_weather_batch([
+        (city, weather_data) for city, weather_data in zip(cities, results) if "error" not in weather_data
+    ])
+    return {"results": results}
+
+@app.get(LIVE_PATH)
+async def live_weather(cities: str, units: str = "metric", lang: str = "pt_br"):
+    """Clima atual por Server-Sent Events. Ex: /live?cities=São Paulo,Recife
+
+    Envia a última leitura de cada cidade ao conectar e depois só as que mudarem.
+    """
+    city_list = [city.strip() for city in cities.split(',') if city.strip()]
+    if not city_list:
+        raise HTTPException(status_code=400, detail="Informe ao menos uma cidade")
+    if len(city_list) > config.LIVE_MAX_CITIES:
+        raise HTTPException(status_code=400, detail=f"Máximo {config.LIVE_MAX_CITIES} cidades por assinatura")
+    try:
+        subscription = live_hub.subscribe(city_list, units, lang)
+    except OverflowError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    async def stream():
+        try:
+            # Intervalo de reconexão sugerido ao EventSource (ms)
+            yield b"retry: 5000\n\n"
+            async for event in subscription.events(config.LIVE_KEEPALIVE):
+                yield event
+        finally:
+            live_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/cities/autocomplete")
+def autocomplete_cities(q: str, limit: int = Query(10, ge=1, le=50)):
+    """Sugestões de cidades pelo prefixo do nome. Ex: /cities/autocomplete?q=sao pa"""
+    if city_index is None:
+        raise HTTPException(status_code=503, detail="Índice de cidades não configurado")
+    return city_index.autocomplete(q, limit)
+
+@app.get("/stats")
+def get_stats():
+    """Métricas de cache e de coalescência de chamadas ao OpenWeatherMap"""
+    return {
+        "cache": weather_service.cache.stats(),
+        "negative_cache": weather_service.negative_cache.stats(),
+        "singleflight": weather_service.flight.stats(),
+        "prefetch": prefetcher.stats(),
+        "rate_limit": weather_service.limiter.stats(),
+        "prefetch_rate_limit": (
+            weather_service.prefetch_limiter.stats() if weather_service.prefetch_limiter is not None else None
+        ),
+        "live": live_hub.stats(),
+    }
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Métricas no formato de texto do Prometheus"""
+    if not config.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Métricas desativadas")
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "service": "WeatherViz API"}
+    # Com o circuito aberto a API segue respondendo, mas só com dados em cache
+    upstream = weather_service.breaker.stats()
+    status = "healthy" if upstream["state"] == CLOSED else "degraded"
+    return {"status": status, "service": "WeatherViz API", "upstream": upstream}
 
 # Para Vercel
 handler = app
@@ -22,6 +22,17 @@ class WeatherHistory(BaseModel):
     description: str
     timestamp: str
 
+class WeatherAsOf(BaseModel):
+    city: str
+    source: str  # "observed" (histórico) ou "forecast" (previsão guardada)
+    timestamp: str
+    temperature: float
+    feels_like: float
+    humidity: int
+    wind_speed: float
+    description: str
+    issued_at: Optional[str] = None
+
 class ErrorResponse(BaseModel):
     error: str
     message: str
@@ -38,4 +49,27 @@ class ForecastItem(BaseModel):
 class ForecastResponse(BaseModel):
     city: str
     country: str
-    forecasts: List[ForecastItem]
\ No newline at end of file
+    forecasts: List[ForecastItem]
+
+class AggregateStats(BaseModel):
+    min: float
+    max: float
+    mean: float
+
+class HistoryBucket(BaseModel):
+    bucket: str
+    count: int
+    temperature: AggregateStats
+    humidity: AggregateStats
+    wind_speed: AggregateStats
+    feels_like: AggregateStats
+
+class HistoryAggregate(BaseModel):
+    city: str
+    bucket_seconds: int
+    buckets: List[HistoryBucket]
+
+class BatchWeatherRequest(BaseModel):
+    cities: List[str]
+    units: str = "metric"
+    lang: str = "pt_br"
@@ -0,0 +1,398 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional
+
+import config
+from database import (
+    EXPORT_COLUMNS, METRICS, ROLLUPS, HistoryStore, as_of_result, decode_cursor, rollup_batch,
+    rollup_columns, to_db_timestamp, to_epoch
+)
+
+try:
+    import psycopg
+    from psycopg.rows import dict_row, tuple_row
+    from psycopg_pool import ConnectionPool
+except ImportError:  # Só necessário com HISTORY_BACKEND=postgres
+    psycopg = None
+
+logger = logging.getLogger(__name__)
+
+COPY_WEATHER = """
+    COPY weather_history (city, temperature, humidity, wind_speed, feels_like, description, timestamp)
+    FROM STDIN
+"""
+
+INSERT_SNAPSHOT = """
+    INSERT INTO forecast_snapshots
+    (city, target_time, issued_at, temperature, feels_like, humidity, wind_speed, description)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT DO NOTHING
+"""
+
+# Mesmo formato de texto do SQLite, para que cursores e respostas sejam idênticos
+TIMESTAMP_TEXT = "to_char(h.timestamp, 'YYYY-MM-DD HH24:MI:SS') AS timestamp"
+
+HISTORY_COLUMNS = (
+    "h.id, h.city, h.temperature, h.humidity, h.wind_speed, h.feels_like, h.description, " + TIMESTAMP_TEXT
+)
+
+
+def _rollup_table_sql(name: str) -> str:
+    metric_columns = "".join(
+        f"{metric}_sum DOUBLE PRECISION NOT NULL, {metric}_min DOUBLE PRECISION NOT NULL, "
+        f"{metric}_max DOUBLE PRECISION NOT NULL, "
+        for metric in METRICS
+    )
+    return f"""
+        CREATE TABLE IF NOT EXISTS weather_rollup_{name} (
+            city TEXT NOT NULL,
+            bucket BIGINT NOT NULL,
+            count INTEGER NOT NULL,
+            {metric_columns}
+            PRIMARY KEY (city, bucket)
+        )
+    """
+
+
+def _rollup_backfill_sql(name: str) -> str:
+    seconds = ROLLUPS[name]
+    metric_columns = ", ".join(f"SUM({metric}), MIN({metric}), MAX({metric})" for metric in METRICS)
+    return f"""
+        INSERT INTO weather_rollup_{name} ({", ".join(rollup_columns())})
+        SELECT city, (floor(extract(epoch FROM timestamp) / {seconds}) * {seconds})::bigint AS bucket,
+               COUNT(*), {metric_columns}
+        FROM weather_history
+        GROUP BY 1, 2
+        ON CONFLICT DO NOTHING
+    """
+
+
+def _rollup_upsert_sql(name: str) -> str:
+    table = f"weather_rollup_{name}"
+    columns = rollup_columns()
+    updates = [f"count = {table}.count + excluded.count"]
+    for metric in METRICS:
+        updates += [
+            f"{metric}_sum = {table}.{metric}_sum + excluded.{metric}_sum",
+            f"{metric}_min = LEAST({table}.{metric}_min, excluded.{metric}_min)",
+            f"{metric}_max = GREATEST({table}.{metric}_max, excluded.{metric}_max)",
+        ]
+    return f"""
+        INSERT INTO {table} ({", ".join(columns)})
+        VALUES ({", ".join("%s" for _ in columns)})
+        ON CONFLICT (city, bucket) DO UPDATE SET {", ".join(updates)}
+    """
+
+
+def _month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(month: datetime) -> datetime:
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def _partition_name(month: datetime) -> str:
+    return f"weather_history_{month:%Y%m}"
+
+
+class PostgresDB(HistoryStore):
+    """Histórico em PostgreSQL, compartilhado entre réplicas.
+
+    `weather_history` é particionada por mês (partições criadas sob demanda),
+    então consultas por período só leem os meses envolvidos e a retenção apaga
+    meses inteiros com DROP TABLE, sem DELETE nem VACUUM. Os lotes da thread de
+    escrita entram com COPY e atualizam os rollups horário e diário na mesma
+    transação, como no SQLite; as leituras usam um pool de conexões.
+    """
+
+    def __init__(self, dsn: str, batch_size: Optional[int] = None, flush_interval: Optional[float] = None,
+                 pool_size: Optional[int] = None):
+        if psycopg is None:
+            raise RuntimeError("HISTORY_BACKEND=postgres requer os pacotes psycopg e psycopg-pool")
+        super().__init__(batch_size, flush_interval)
+        self.dsn = dsn
+        self.pool_size = pool_size or config.DB_POOL_SIZE
+        self._pool_lock = threading.Lock()
+        self._pool_instance: Optional[ConnectionPool] = None
+        self._pool_pid: Optional[int] = None
+        self._partitions = set()
+        self.init_db()
+
+    @property
+    def _pool(self) -> ConnectionPool:
+        """Pool do processo atual (recriado após fork: conexões não podem ser compartilhadas)"""
+        with self._pool_lock:
+            if self._pool_instance is None or self._pool_pid != os.getpid():
+                self._pool_instance = ConnectionPool(
+                    self.dsn, min_size=1, max_size=self.pool_size, kwargs={"row_factory": dict_row}, open=True
+                )
+                self._pool_pid = os.getpid()
+            return self._pool_instance
+
+    def init_db(self):
+        with self._pool.connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS weather_history (
+                    id BIGSERIAL,
+                    city TEXT NOT NULL,
+                    temperature DOUBLE PRECISION NOT NULL,
+                    humidity INTEGER NOT NULL,
+                    wind_speed DOUBLE PRECISION NOT NULL,
+                    feels_like DOUBLE PRECISION NOT NULL,
+                    description TEXT NOT NULL,
+                    timestamp TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+                ) PARTITION BY RANGE (timestamp)
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_weather_history_city_timestamp
+                ON weather_history (city, timestamp, id)
+            """)
+            # A chave primária é o índice da consulta as_of (previsão mais recente para um horário)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS forecast_snapshots (
+                    city TEXT NOT NULL,
+                    target_time TIMESTAMP NOT NULL,
+                    issued_at TIMESTAMP NOT NULL,
+                    temperature DOUBLE PRECISION NOT NULL,
+                    feels_like DOUBLE PRECISION NOT NULL,
+                    humidity INTEGER NOT NULL,
+                    wind_speed DOUBLE PRECISION NOT NULL,
+                    description TEXT NOT NULL,
+                    PRIMARY KEY (city, target_time, issued_at)
+                )
+            """)
+            for name in ROLLUPS:
+                exists = conn.execute("SELECT to_regclass(%s) AS name", (f"weather_rollup_{name}",)).fetchone()
+                conn.execute(_rollup_table_sql(name))
+                if exists["name"] is None:
+                    # Rollup novo em um banco que já tem histórico: preenche com as linhas existentes
+                    conn.execute(_rollup_backfill_sql(name))
+        month = _month_start(datetime.now(timezone.utc).replace(tzinfo=None))
+        self._ensure_partitions([month, _next_month(month)])
+
+    def _ensure_partitions(self, months: List[datetime]):
+        for month in months:
+            if month in self._partitions:
+                continue
+            try:
+                with self._pool.connection() as conn:
+                    conn.execute(
+                        f"CREATE TABLE IF NOT EXISTS {_partition_name(month)} PARTITION OF weather_history "
+                        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_next_month(month):%Y-%m-%d}')"
+                    )
+            except (psycopg.errors.DuplicateTable, psycopg.errors.UniqueViolation):
+                pass  # Criada ao mesmo tempo por outra réplica
+            self._partitions.add(month)
+
+    def close(self, timeout: Optional[float] = None):
+        super().close(timeout)
+        with self._pool_lock:
+            if self._pool_instance is not None and self._pool_pid == os.getpid():
+                self._pool_instance.close()
+            self._pool_instance = None
+
+    def stats(self) -> Dict[str, int]:
+        stats = super().stats()
+        with self._pool_lock:
+            if self._pool_instance is not None and self._pool_pid == os.getpid():
+                pool = self._pool_instance.get_stats()
+                stats.update({
+                    "pool_size": pool.get("pool_size", 0),
+                    "pool_available": pool.get("pool_available", 0),
+                    "pool_requests_waiting": pool.get("requests_waiting", 0),
+                })
+        return stats
+
+    def _open_writer(self):
+        return None
+
+    def _write_batch(self, conn, rows: List[tuple]):
+        months = {datetime.strptime(row[6][:7], "%Y-%m") for row in rows}
+        self._ensure_partitions(sorted(months))
+        with self._pool.connection() as conn:
+            with conn.cursor() as cursor:
+                with cursor.copy(COPY_WEATHER) as copy:
+                    for row in rows:
+                        copy.write_row(row)
+                for name, seconds in ROLLUPS.items():
+                    # Em ordem de chave: réplicas gravando ao mesmo tempo travam as linhas na mesma ordem
+                    cursor.executemany(_rollup_upsert_sql(name), sorted(rollup_batch(rows, seconds)))
+
+    def _write_snapshots(self, conn, rows: List[tuple]):
+        with self._pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.executemany(INSERT_SNAPSHOT, rows)
+
+    def as_of(self, city: str, at: datetime) -> Optional[Dict]:
+        timestamp = to_db_timestamp(at)
+        with self._pool.connection() as conn:
+            observed = conn.execute(f"""
+                SELECT {TIMESTAMP_TEXT}, h.temperature, h.feels_like, h.humidity, h.wind_speed, h.description
+                FROM weather_history h
+                WHERE h.city = %s AND h.timestamp <= %s::timestamp
+                ORDER BY h.timestamp DESC, h.id DESC
+                LIMIT 1
+            """, (city.lower(), timestamp)).fetchone()
+            forecast = conn.execute("""
+                SELECT to_char(target_time, 'YYYY-MM-DD HH24:MI:SS') AS timestamp, temperature, feels_like,
+                       humidity, wind_speed, description, to_char(issued_at, 'YYYY-MM-DD HH24:MI:SS') AS issued_at
+                FROM forecast_snapshots
+                WHERE city = %s AND target_time <= %s::timestamp
+                ORDER BY target_time DESC, issued_at DESC
+                LIMIT 1
+            """, (city.lower(), timestamp)).fetchone()
+        return as_of_result(city, observed, forecast)
+
+    def get_city_history(self, city: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                         limit: int = 50, cursor: Optional[str] = None) -> List[Dict]:
+        """Histórico mais recente primeiro, com paginação por cursor (keyset)"""
+        conditions = ["h.city = %s"]
+        params: list = [city.lower()]
+        if since is not None:
+            conditions.append("h.timestamp >= %s::timestamp")
+            params.append(to_db_timestamp(since))
+        if until is not None:
+            conditions.append("h.timestamp <= %s::timestamp")
+            params.append(to_db_timestamp(until))
+        if cursor is not None:
+            conditions.append("(h.timestamp, h.id) < (%s::timestamp, %s)")
+            params.extend(decode_cursor(cursor))
+        params.append(limit)
+
+        with self._pool.connection() as conn:
+            return conn.execute(f"""
+                SELECT {HISTORY_COLUMNS} FROM weather_history h
+                WHERE {" AND ".join(conditions)}
+                ORDER BY h.timestamp DESC, h.id DESC
+                LIMIT %s
+            """, params).fetchall()
+
+    def iter_history(self, cities: List[str], since: Optional[datetime] = None, until: Optional[datetime] = None,
+                     chunk_size: int = 5000) -> Iterator[List[tuple]]:
+        """Histórico completo das cidades em blocos, lido por um cursor no servidor"""
+        columns = ", ".join(TIMESTAMP_TEXT if column == "timestamp" else f"h.{column}" for column in EXPORT_COLUMNS)
+        for city in cities:
+            conditions = ["h.city = %s"]
+            params: list = [city.lower()]
+            if since is not None:
+                conditions.append("h.timestamp >= %s::timestamp")
+                params.append(to_db_timestamp(since))
+            if until is not None:
+                conditions.append("h.timestamp <= %s::timestamp")
+                params.append(to_db_timestamp(until))
+            with self._pool.connection() as conn:
+                with conn.cursor(name="weatherviz_export", row_factory=tuple_row) as server_cursor:
+                    server_cursor.itersize = chunk_size
+                    server_cursor.execute(f"""
+                        SELECT {columns} FROM weather_history h
+                        WHERE {" AND ".join(conditions)}
+                        ORDER BY h.timestamp, h.id
+                    """, params)
+                    while True:
+                        rows = server_cursor.fetchmany(chunk_size)
+                        if not rows:
+                            break
+                        yield rows
+
+    def _aggregate_raw(self, city: str, bucket_seconds: int, since: Optional[datetime],
+                       until: Optional[datetime]) -> List:
+        # Só as partições do período são varridas
+        conditions = ["city = %s"]
+        params: list = [bucket_seconds, bucket_seconds, city.lower()]
+        if since is not None:
+            conditions.append("timestamp >= %s::timestamp")
+            params.append(to_db_timestamp(since))
+        if until is not None:
+            conditions.append("timestamp < %s::timestamp")
+            params.append(to_db_timestamp(until))
+        columns = ", ".join(
+            f"MIN({metric}) AS {metric}_min, MAX({metric}) AS {metric}_max, SUM({metric})::float8 AS {metric}_sum"
+            for metric in METRICS
+        )
+
+        with self._pool.connection() as conn:
+            return conn.execute(f"""
+                SELECT (floor(extract(epoch FROM timestamp) / %s) * %s)::bigint AS bucket,
+                       COUNT(*) AS count, {columns}
+                FROM weather_history
+                WHERE {" AND ".join(conditions)}
+                GROUP BY 1
+            """, params).fetchall()
+
+    def _aggregate_rollup(self, rollup: str, city: str, bucket_seconds: int, start: Optional[int],
+                          end: Optional[int]) -> List:
+        conditions = ["city = %s"]
+        params: list = [bucket_seconds, bucket_seconds, city.lower()]
+        if start is not None:
+            conditions.append("bucket >= %s")
+            params.append(start)
+        if end is not None:
+            conditions.append("bucket < %s")
+            params.append(end)
+        columns = ", ".join(
+            f"MIN({metric}_min) AS {metric}_min, MAX({metric}_max) AS {metric}_max, "
+            f"SUM({metric}_sum) AS {metric}_sum"
+            for metric in METRICS
+        )
+
+        with self._pool.connection() as conn:
+            return conn.execute(f"""
+                SELECT (bucket / %s) * %s AS bucket, SUM(count)::bigint AS count, {columns}
+                FROM weather_rollup_{rollup}
+                WHERE {" AND ".join(conditions)}
+                GROUP BY 1
+            """, params).fetchall()
+
+    def apply_retention(self) -> Dict:
+        """Apaga as partições mensais inteiramente mais antigas que RETENTION_RAW_DAYS.
+
+        As séries agregadas continuam nos rollups: os horários mais antigos que
+        RETENTION_HOURLY_DAYS são apagados e os diários, mantidos.
+        """
+        started = time.monotonic()
+        dropped = []
+        if config.RETENTION_RAW_DAYS:
+            cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=config.RETENTION_RAW_DAYS)
+            with self._pool.connection() as conn:
+                partitions = [row["relname"] for row in conn.execute("""
+                    SELECT child.relname FROM pg_inherits
+                    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                    WHERE pg_inherits.inhparent = 'weather_history'::regclass
+                """)]
+                for name in sorted(partitions):
+                    try:
+                        month = datetime.strptime(name.rsplit("_", 1)[-1], "%Y%m")
+                    except ValueError:
+                        continue
+                    if _next_month(month) <= cutoff:
+                        conn.execute(f"DROP TABLE {name}")
+                        self._partitions.discard(month)
+                        dropped.append(name)
+
+        snapshots_pruned = 0
+        if config.RETENTION_RAW_DAYS:
+            with self._pool.connection() as conn:
+                snapshots_pruned = conn.execute(
+                    "DELETE FROM forecast_snapshots WHERE target_time < %s::timestamp", (to_db_timestamp(cutoff),)
+                ).rowcount
+
+        hourly_pruned = 0
+        if config.RETENTION_HOURLY_DAYS:
+            cutoff = datetime.now(timezone.utc) - timedelta(days=config.RETENTION_HOURLY_DAYS)
+            with self._pool.connection() as conn:
+                hourly_pruned = conn.execute(
+                    "DELETE FROM weather_rollup_hourly WHERE bucket < %s", (to_epoch(to_db_timestamp(cutoff)),)
+                ).rowcount
+
+        report = {
+            "partitions_dropped": dropped,
+            "hourly_rows_pruned": hourly_pruned,
+            "forecast_snapshots_pruned": snapshots_pruned,
+            "duration_seconds": round(time.monotonic() - started, 3),
+        }
+        logger.info("Retenção concluída: %s", report)
+        return report
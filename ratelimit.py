@@ -0,0 +1,116 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Callable, Dict, List, Optional
+
+# Filas de prioridade: menor valor é atendido primeiro
+INTERACTIVE = 0
+COMPARE = 1
+PREFETCH = 2
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", COMPARE: "compare", PREFETCH: "prefetch"}
+
+
+class RateLimitExceeded(Exception):
+    """Cota de chamadas ao OpenWeatherMap esgotada dentro do prazo de espera"""
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, period: float, clock: Callable[[], float] = time.monotonic):
+        # Cotas menores que uma chamada por período (divididas entre muitos workers)
+        # mantêm a taxa, mas acumulam até uma ficha para a chamada poder sair
+        self.capacity = max(capacity, 1.0)
+        self.rate = capacity / period
+        self.tokens = capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self) -> float:
+        self._refill()
+        return self.tokens
+
+    def wait_time(self) -> float:
+        """Segundos até haver uma ficha disponível"""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def take(self):
+        self.tokens -= 1
+
+
+class RateLimiter:
+    """Limitador por token bucket (por minuto e por dia) com fila priorizada.
+
+    Quando não há fichas, a chamada espera na fila da sua prioridade até o prazo
+    informado; interativas são atendidas antes de comparação e pré-busca.
+    Limites iguais a zero são ignorados.
+    """
+
+    def __init__(self, per_minute: float, per_day: float, clock: Callable[[], float] = time.monotonic):
+        self._buckets: Dict[str, TokenBucket] = {}
+        if per_minute:
+            self._buckets["minute"] = TokenBucket(per_minute, 60, clock)
+        if per_day:
+            self._buckets["day"] = TokenBucket(per_day, 86400, clock)
+        self._waiters: List[list] = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.granted = 0
+        self.rejected = 0
+
+    async def acquire(self, priority: int = INTERACTIVE, timeout: Optional[float] = None):
+        if not self._pending() and self._try_take():
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [priority, next(self._sequence), future])
+        self._schedule()
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise RateLimitExceeded("Limite de chamadas ao OpenWeatherMap atingido. Tente novamente em instantes")
+
+    def _pending(self) -> bool:
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        return bool(self._waiters)
+
+    def _try_take(self) -> bool:
+        if any(bucket.available() < 1 for bucket in self._buckets.values()):
+            return False
+        for bucket in self._buckets.values():
+            bucket.take()
+        self.granted += 1
+        return True
+
+    def _dispatch(self):
+        self._timer = None
+        while self._pending() and self._try_take():
+            heapq.heappop(self._waiters)[2].set_result(None)
+        self._schedule()
+
+    def _schedule(self):
+        if self._timer is not None or not self._pending():
+            return
+        delay = max((bucket.wait_time() for bucket in self._buckets.values()), default=0.0)
+        self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def stats(self) -> Dict:
+        queued = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                queued[PRIORITY_NAMES.get(priority, str(priority))] += 1
+        return {
+            "remaining": {name: int(bucket.available()) for name, bucket in self._buckets.items()},
+            "queue_depth": sum(queued.values()),
+            "queued": queued,
+            "granted": self.granted,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,105 @@
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+import config
+from database import WeatherDB, to_epoch, to_db_timestamp
+
+logger = logging.getLogger(__name__)
+
+INCREMENTAL_VACUUM = 2
+
+
+def run_retention(
+    db: WeatherDB,
+    raw_days: Optional[float] = None,
+    hourly_days: Optional[float] = None,
+    batch_size: Optional[int] = None,
+    pause: Optional[float] = None,
+    now: Optional[datetime] = None,
+) -> Dict:
+    """Remove histórico antigo em transações pequenas e devolve o espaço ao disco.
+
+    As linhas brutas já estão resumidas nos rollups horário e diário (mantidos a
+    cada gravação), então as mais antigas que `raw_days` podem ser apagadas sem
+    perder as séries agregadas. Rollups horários mais antigos que `hourly_days`
+    também são apagados; os diários são mantidos. Previsões para horários mais
+    antigos que `raw_days` seguem a mesma regra das linhas brutas.
+    """
+    raw_days = config.RETENTION_RAW_DAYS if raw_days is None else raw_days
+    hourly_days = config.RETENTION_HOURLY_DAYS if hourly_days is None else hourly_days
+    batch_size = batch_size or config.RETENTION_BATCH_SIZE
+    pause = config.RETENTION_PAUSE if pause is None else pause
+    now = now or datetime.now(timezone.utc)
+    started = time.monotonic()
+
+    # Garante que o histórico pendente já esteja nos rollups
+    db.flush()
+    conn = db._connect()
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        pages_before = conn.execute("PRAGMA page_count").fetchone()[0]
+
+        raw_pruned = 0
+        if raw_days:
+            cutoff = to_db_timestamp(now - timedelta(days=raw_days))
+            while True:
+                with conn:
+                    deleted = conn.execute("""
+                        DELETE FROM weather_history WHERE id IN (
+                            SELECT id FROM weather_history WHERE timestamp < ? LIMIT ?
+                        )
+                    """, (cutoff, batch_size)).rowcount
+                raw_pruned += deleted
+                if deleted < batch_size:
+                    break
+                # Libera o lock de escrita para a thread de gravação do histórico
+                time.sleep(pause)
+
+        hourly_pruned = 0
+        if hourly_days:
+            cutoff = to_epoch(to_db_timestamp(now - timedelta(days=hourly_days)))
+            # O rollup diário é pequeno e lista todas as cidades com histórico
+            cities = [row[0] for row in conn.execute("SELECT DISTINCT city FROM weather_rollup_daily")]
+            for city in cities:
+                with conn:
+                    hourly_pruned += conn.execute(
+                        "DELETE FROM weather_rollup_hourly WHERE city = ? AND bucket < ?", (city, cutoff)
+                    ).rowcount
+
+        snapshots_pruned = 0
+        if raw_days:
+            cutoff = to_db_timestamp(now - timedelta(days=raw_days))
+            cities = [row[0] for row in conn.execute("SELECT DISTINCT city FROM forecast_snapshots")]
+            for city in cities:
+                # Pela chave primária (city, target_time, issued_at), uma cidade por transação
+                with conn:
+                    snapshots_pruned += conn.execute(
+                        "DELETE FROM forecast_snapshots WHERE city = ? AND target_time < ?", (city, cutoff)
+                    ).rowcount
+
+        vacuumed = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == INCREMENTAL_VACUUM
+        if vacuumed:
+            while conn.execute("PRAGMA freelist_count").fetchone()[0]:
+                # Pelo execute() o sqlite3 avança o pragma um passo só (uma página por chamada);
+                # executescript() o executa até o fim e libera as N páginas de uma vez
+                conn.executescript(f"PRAGMA incremental_vacuum({config.RETENTION_VACUUM_PAGES});")
+                time.sleep(pause)
+        else:
+            logger.info("auto_vacuum incremental desativado; execute 'python database.py enable-incremental-vacuum'")
+
+        pages_after = conn.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        conn.close()
+
+    report = {
+        "raw_rows_pruned": raw_pruned,
+        "hourly_rows_pruned": hourly_pruned,
+        "forecast_snapshots_pruned": snapshots_pruned,
+        "bytes_reclaimed": max(pages_before - pages_after, 0) * page_size,
+        "incremental_vacuum": vacuumed,
+        "duration_seconds": round(time.monotonic() - started, 3),
+    }
+    logger.info("Retenção concluída: %s", report)
+    return report
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+import config
+from database import HistoryStore
+from weather_service import AsyncWeatherService
+
+logger = logging.getLogger(__name__)
+
+
+def load_watchlist() -> List[str]:
+    """Cidades monitoradas: WATCHLIST (separadas por vírgula) e WATCHLIST_FILE (uma por linha)"""
+    cities = list(config.WATCHLIST)
+    if config.WATCHLIST_FILE:
+        with open(config.WATCHLIST_FILE, encoding="utf-8") as file:
+            cities += [line.strip() for line in file if line.strip() and not line.startswith("#")]
+    # Remove duplicatas mantendo a ordem
+    return list(dict.fromkeys(cities))
+
+
+class PrefetchScheduler:
+    """Atualiza clima e previsão das cidades monitoradas antes de serem pedidas.
+
+    As consultas são distribuídas uniformemente ao longo de `interval`, uma
+    cidade por vez, para não estourar o limite de chamadas do OpenWeatherMap.
+    Os resultados vão para o cache do serviço e para o histórico.
+    """
+
+    def __init__(self, service: AsyncWeatherService, db: HistoryStore, cities: List[str],
+                 interval: Optional[float] = None, forecast_interval: Optional[float] = None,
+                 units: Optional[str] = None, lang: Optional[str] = None):
+        self.service = service
+        self.db = db
+        self.cities = cities
+        self.interval = interval or config.PREFETCH_INTERVAL
+        self.forecast_interval = forecast_interval or config.PREFETCH_FORECAST_INTERVAL
+        self.units = units or config.PREFETCH_UNITS
+        self.lang = lang or config.PREFETCH_LANG
+        self._task: Optional[asyncio.Task] = None
+        self.cycles = 0
+        self.refreshed = 0
+        self.failures = 0
+
+    def start(self):
+        if self.cities and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        spacing = self.interval / len(self.cities)
+        # Entradas valem até a próxima passada, com folga para atrasos
+        weather_ttl = max(config.WEATHER_CACHE_TTL, self.interval * 1.2)
+        forecast_every = max(1, round(self.forecast_interval / self.interval))
+        next_at = time.monotonic()
+        while True:
+            with_forecast = self.cycles % forecast_every == 0
+            for city in self.cities:
+                await self._refresh_city(city, weather_ttl, with_forecast)
+                next_at += spacing
+                await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+            self.cycles += 1
+
+    async def _refresh_city(self, city: str, weather_ttl: float, with_forecast: bool):
+        try:
+            weather_data = await self.service.refresh_weather(city, self.units, self.lang, ttl=weather_ttl)
+            self.db.save_weather_data(city, weather_data)
+            if with_forecast:
+                await self.service.refresh_forecast(
+                    city, self.units, self.lang, ttl=max(config.FORECAST_CACHE_TTL, self.forecast_interval * 1.2)
+                )
+            self.refreshed += 1
+        except Exception:
+            self.failures += 1
+            logger.warning("Falha na pré-busca de '%s'", city, exc_info=True)
+
+    def stats(self) -> Dict:
+        return {
+            "cities": len(self.cities),
+            "interval": self.interval,
+            "cycles": self.cycles,
+            "refreshed": self.refreshed,
+            "failures": self.failures,
+            "running": self._task is not None and not self._task.done(),
+        }
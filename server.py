@@ -0,0 +1,42 @@
+"""
+Worker do gunicorn para a API (usado por gunicorn.conf.py).
+
+Igual ao UvicornWorker, mas com encerramento gracioso: ao receber SIGTERM o
+worker para de aceitar conexões, avisa a aplicação (app.state.drain_callbacks)
+para encerrar os streams ao vivo e espera as requisições em andamento por até
+GRACEFUL_TIMEOUT segundos antes do shutdown da aplicação.
+"""
+import sys
+from typing import Callable, List
+
+from gunicorn.arbiter import Arbiter
+from uvicorn import Config, Server
+from uvicorn.workers import UvicornWorker
+
+import config
+
+
+class DrainingServer(Server):
+    def __init__(self, config: Config, drain_callbacks: List[Callable[[], None]]):
+        super().__init__(config)
+        self.drain_callbacks = drain_callbacks
+
+    def handle_exit(self, sig, frame):
+        draining = not self.should_exit
+        super().handle_exit(sig, frame)
+        if draining:
+            for callback in self.drain_callbacks:
+                callback()
+
+
+class WeatherVizWorker(UvicornWorker):
+    CONFIG_KWARGS = {**UvicornWorker.CONFIG_KWARGS, "timeout_graceful_shutdown": config.GRACEFUL_TIMEOUT}
+
+    async def _serve(self):
+        self.config.app = self.wsgi
+        state = getattr(self.wsgi, "state", None)
+        server = DrainingServer(self.config, getattr(state, "drain_callbacks", []))
+        self._install_sigquit_handler()
+        await server.serve(sockets=self.sockets)
+        if not server.started:
+            sys.exit(Arbiter.WORKER_BOOT_ERROR)
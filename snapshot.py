@@ -0,0 +1,79 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Tuple
+
+import orjson
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos (um único worker)
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+# (chave, valor, vence em, sai do stale em), instantes do relógio de parede
+Entry = Tuple[str, Any, float, float]
+
+
+@contextmanager
+def _locked(path: str):
+    """Trava exclusiva entre os workers que gravam o mesmo snapshot"""
+    with open(f"{path}.lock", "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def read_snapshot(path: str) -> Dict:
+    """Conteúdo do snapshot ({"entries": [...], "city_ids": {...}}), vazio se não existir ou for inválido"""
+    try:
+        with open(path, "rb") as file:
+            data = orjson.loads(file.read())
+    except FileNotFoundError:
+        return {"entries": [], "city_ids": {}}
+    except (OSError, orjson.JSONDecodeError):
+        logger.warning("Snapshot do cache ilegível em %s; ignorado", path, exc_info=True)
+        return {"entries": [], "city_ids": {}}
+    if data.get("version") != SNAPSHOT_VERSION:
+        return {"entries": [], "city_ids": {}}
+    return data
+
+
+def write_snapshot(path: str, entries: List[Entry], city_ids: Dict[str, int], keep_expired: float) -> int:
+    """Mescla as entradas deste processo ao snapshot em disco e o regrava de forma atômica.
+
+    Cada worker tem seu próprio cache em memória; a mescla mantém, para cada
+    chave, a entrada que vence por último, de modo que o arquivo reúne o cache de
+    todos. Entradas vencidas há mais de `keep_expired` segundos são descartadas.
+    Devolve o número de entradas gravadas.
+    """
+    now = time.time()
+    with _locked(path):
+        current = read_snapshot(path)
+        merged: Dict[str, list] = {entry[0]: entry for entry in current["entries"]}
+        for entry in entries:
+            existing = merged.get(entry[0])
+            if existing is None or entry[2] >= existing[2]:
+                merged[entry[0]] = list(entry)
+        kept = sorted(
+            (entry for entry in merged.values() if entry[3] + keep_expired > now), key=lambda entry: entry[2]
+        )
+        data = {
+            "version": SNAPSHOT_VERSION,
+            "saved_at": now,
+            "entries": kept,
+            "city_ids": {**current["city_ids"], **city_ids},
+        }
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(orjson.dumps(data))
+        os.replace(temporary, path)
+    return len(kept)
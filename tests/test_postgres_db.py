@@ -0,0 +1,124 @@
+"""PostgresDB contra um PostgreSQL local (DATABASE_URL), comparado ao WeatherDB.
+
+Cada teste usa um schema próprio, apagado ao final.
+"""
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="DATABASE_URL não definida")
+
+psycopg = pytest.importorskip("psycopg")
+
+import config  # noqa: E402
+from database import WeatherDB, _history_row, encode_cursor  # noqa: E402
+from postgres_db import PostgresDB  # noqa: E402
+
+NOW = datetime.utcnow().replace(microsecond=0)
+
+
+def history_rows(count: int, step: timedelta = timedelta(hours=2)):
+    """Leituras de duas cidades, da mais recente (agora) para trás"""
+    return [
+        _history_row(
+            "Natal" if index % 3 == 0 else "Recife",
+            {"temperature": 20 + index % 11, "humidity": 40 + index % 30, "wind_speed": 1.5 + index % 4,
+             "feels_like": 19.25, "description": "Céu Limpo"},
+            (NOW - step * index).strftime("%Y-%m-%d %H:%M:%S"),
+        )
+        for index in range(count)
+    ]
+
+
+def write(db, rows):
+    db._enqueue(rows, len(rows), "teste")
+    assert db.flush(30)
+
+
+@pytest.fixture
+def pg():
+    schema = f"weatherviz_test_{uuid.uuid4().hex[:8]}"
+    with psycopg.connect(DATABASE_URL, autocommit=True) as conn:
+        conn.execute(f"CREATE SCHEMA {schema}")
+    db = PostgresDB(psycopg.conninfo.make_conninfo(DATABASE_URL, options=f"-c search_path={schema}"))
+    try:
+        yield db
+    finally:
+        db.close()
+        with psycopg.connect(DATABASE_URL, autocommit=True) as conn:
+            conn.execute(f"DROP SCHEMA {schema} CASCADE")
+
+
+@pytest.fixture
+def sqlite(tmp_path):
+    db = WeatherDB(str(tmp_path / "weather.db"))
+    yield db
+    db.close()
+
+
+def without_id(rows):
+    return [{key: value for key, value in row.items() if key != "id"} for row in rows]
+
+
+def test_history_pages_match_sqlite(pg, sqlite):
+    rows = history_rows(600)
+    for db in (pg, sqlite):
+        write(db, rows)
+
+    first = pg.get_city_history("recife", limit=50)
+    assert without_id(first) == without_id(sqlite.get_city_history("recife", limit=50))
+    second = pg.get_city_history("recife", limit=50, cursor=encode_cursor(first[-1]))
+    assert len(second) == 50 and second[0]["timestamp"] < first[-1]["timestamp"]
+
+    since = NOW - timedelta(days=3)
+    assert without_id(pg.get_city_history("natal", since=since, limit=1000)) == without_id(
+        sqlite.get_city_history("natal", since=since, limit=1000)
+    )
+
+
+def test_aggregates_match_sqlite_for_rollups_and_raw_rows(pg, sqlite):
+    rows = history_rows(1500)
+    for db in (pg, sqlite):
+        write(db, rows[:700])
+        write(db, rows[700:])
+
+    day = NOW.replace(hour=0, minute=0, second=0)
+    for bucket_seconds, since in (
+        (86400, None), (86400, NOW - timedelta(days=10)), (3600, day - timedelta(days=20)), (900, NOW - timedelta(days=2))
+    ):
+        expected = sqlite.aggregate_history("recife", bucket_seconds, since)
+        assert expected
+        assert pg.aggregate_history("recife", bucket_seconds, since) == expected
+
+
+def test_retention_drops_partitions_and_keeps_daily_rollup(pg, monkeypatch):
+    monkeypatch.setattr(config, "RETENTION_RAW_DAYS", 30)
+    monkeypatch.setattr(config, "RETENTION_HOURLY_DAYS", 60)
+    write(pg, history_rows(1500))
+    daily = pg.aggregate_history("recife", 86400)
+
+    report = pg.apply_retention()
+
+    assert report["partitions_dropped"]
+    assert report["hourly_rows_pruned"] > 0
+    oldest = pg.get_city_history("recife", limit=10000)[-1]["timestamp"]
+    assert datetime.strptime(oldest, "%Y-%m-%d %H:%M:%S") >= NOW - timedelta(days=62)
+    assert pg.aggregate_history("recife", 86400) == daily
+
+
+def test_export_and_as_of(pg):
+    rows = history_rows(100)
+    write(pg, rows)
+
+    exported = [row for chunk in pg.iter_history(["Recife", "Natal"], chunk_size=30) for row in chunk]
+    assert len(exported) == 100
+
+    at = NOW - timedelta(hours=5)
+    result = pg.as_of("Recife", at)
+    assert result["source"] == "observed"
+    assert result["timestamp"] == (NOW - timedelta(hours=8)).strftime("%Y-%m-%d %H:%M:%S")
+    assert pg.as_of("Recife", NOW - timedelta(days=365)) is None
@@ -0,0 +1,118 @@
+"""RedisCache e a trava entre workers, sobre um Redis em memória (fakeredis)."""
+import asyncio
+
+import httpx
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # Scripts Lua (liberação da trava) no fakeredis
+
+from cache import FRESH, MISS, STALE  # noqa: E402
+from cache_backend import RedisCache  # noqa: E402
+from weather_service import AsyncWeatherService  # noqa: E402
+
+
+def weather_payload(name: str) -> dict:
+    return {
+        "id": 3390760,
+        "name": name,
+        "sys": {"country": "BR"},
+        "main": {"temp": 28.5, "feels_like": 31.0, "humidity": 70},
+        "wind": {"speed": 4.1},
+        "weather": [{"description": "algumas nuvens", "icon": "02d"}],
+    }
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def make_cache(server, **kwargs) -> RedisCache:
+    return RedisCache("", client=fakeredis.aioredis.FakeRedis(server=server), **kwargs)
+
+
+def test_fresh_stale_and_last_known(server):
+    async def scenario():
+        cache = make_cache(server)
+        await cache.set("weather:fresh", {"temperature": 1}, ttl=60)
+        await cache.set("weather:stale", {"temperature": 2}, ttl=0, stale_ttl=60)
+        await cache.set("weather:expired", {"temperature": 3}, ttl=0)
+        assert await cache.get("weather:fresh") == (FRESH, {"temperature": 1})
+        assert await cache.get("weather:stale") == (STALE, {"temperature": 2})
+        assert await cache.get("weather:expired") == (MISS, None)
+        # Fora da janela de stale, o último valor conhecido continua disponível
+        assert await cache.peek("weather:expired") == {"temperature": 3}
+        assert await cache.get("weather:missing") == (MISS, None)
+        assert cache.stats()["hits"] == 1 and cache.stats()["stale_hits"] == 1
+        await cache.close()
+
+    asyncio.run(scenario())
+
+
+def test_set_many_and_get_many_share_entries_between_workers(server):
+    async def scenario():
+        writer, reader = make_cache(server), make_cache(server)
+        await writer.set_many([(f"weather:{index}", {"index": index}) for index in range(5)], ttl=60)
+        lookups = await reader.get_many([f"weather:{index}" for index in range(6)])
+        assert lookups[:5] == [(FRESH, {"index": index}) for index in range(5)]
+        assert lookups[5] == (MISS, None)
+        await writer.close()
+        await reader.close()
+
+    asyncio.run(scenario())
+
+
+def test_lock_is_exclusive_and_released_only_by_its_owner(server):
+    async def scenario():
+        first, second = make_cache(server), make_cache(server)
+        token = await first.acquire_lock("weather:recife", ttl=5)
+        assert token is not None
+        assert await second.acquire_lock("weather:recife", ttl=5) is None
+        await second.release_lock("weather:recife", "outro-token")
+        assert await second.acquire_lock("weather:recife", ttl=5) is None
+        await first.release_lock("weather:recife", token)
+        assert await second.acquire_lock("weather:recife", ttl=5) is not None
+        await first.close()
+        await second.close()
+
+    asyncio.run(scenario())
+
+
+def test_workers_coalesce_upstream_calls_through_the_lock(server, monkeypatch):
+    monkeypatch.setenv("OPENWEATHER_API_KEY", "teste")
+    calls = []
+
+    async def upstream(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url)
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, json=weather_payload(request.url.params["q"]))
+
+    async def scenario():
+        workers = [
+            AsyncWeatherService(
+                cache=make_cache(server, poll_interval=0.01),
+                client=httpx.AsyncClient(transport=httpx.MockTransport(upstream)),
+            )
+            for _ in range(2)
+        ]
+        results = await asyncio.gather(*(workers[index % 2].get_weather("Recife") for index in range(20)))
+        assert len(calls) == 1
+        assert {result["city"] for result in results} == {"Recife"}
+        assert sum(worker.cache.stats()["lock_waits"] for worker in workers) >= 1
+        for worker in workers:
+            await worker.close()
+
+    asyncio.run(scenario())
+
+
+def test_redis_failures_are_treated_as_empty_cache(server):
+    async def scenario():
+        cache = make_cache(server)
+        server.connected = False
+        await cache.set("weather:recife", {"temperature": 1}, ttl=60)
+        assert await cache.get("weather:recife") == (MISS, None)
+        assert await cache.acquire_lock("weather:recife", ttl=5) is not None
+        assert cache.stats()["errors"] == 3
+
+    asyncio.run(scenario())
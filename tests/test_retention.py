@@ -0,0 +1,55 @@
+"""Retenção do WeatherDB: o histórico bruto expira, as séries agregadas ficam."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from database import WeatherDB, _history_row
+from retention import run_retention
+
+NOW = datetime(2024, 6, 30, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = WeatherDB(str(tmp_path / "weather.db"))
+    rows = [
+        _history_row(
+            "Recife",
+            {"temperature": 20 + index % 11, "humidity": 40 + index % 30, "wind_speed": 1.5,
+             "feels_like": 19.25, "description": "Céu Limpo"},
+            (NOW - timedelta(hours=3 * index)).strftime("%Y-%m-%d %H:%M:%S"),
+        )
+        for index in range(8 * 60)  # 60 dias, a cada 3 horas
+    ]
+    database._enqueue(rows, len(rows), "teste")
+    assert database.flush(30)
+    yield database
+    database.close()
+
+
+def test_backfill_after_retention_keeps_pruned_buckets(db):
+    daily = db.aggregate_history("recife", 86400)
+    hourly = db.aggregate_history("recife", 3600)
+    assert len(daily) == 61
+
+    report = run_retention(db, raw_days=30, hourly_days=365, pause=0, now=NOW)
+    assert report["raw_rows_pruned"] > 0
+    assert db.aggregate_history("recife", 86400) == daily
+
+    db.backfill_rollups()
+    assert db.aggregate_history("recife", 86400) == daily
+    assert db.aggregate_history("recife", 3600) == hourly
+
+
+def test_unaligned_range_after_retention_reads_whole_buckets_from_rollups(db):
+    since, until = NOW - timedelta(days=40), NOW
+    before = db.aggregate_history("recife", 86400, since, until)
+
+    run_retention(db, raw_days=30, hourly_days=365, pause=0, now=NOW)
+
+    # Só o dia parcial do início dependia das linhas brutas já apagadas
+    assert db.aggregate_history("recife", 86400, since, until) == before[1:]
+    assert db.aggregate_history("recife", 3600, since, until) == [
+        bucket for bucket in db.aggregate_history("recife", 3600)
+        if "2024-05-21 12:00:00" <= bucket["bucket"] < "2024-06-30 12:00:00"
+    ]
@@ -0,0 +1,102 @@
+"""AsyncWeatherService sobre um OpenWeatherMap simulado (httpx.MockTransport)."""
+import asyncio
+
+import httpx
+import pytest
+
+import config
+
+from cache import FRESH
+from cache_backend import MemoryCache
+from gazetteer import CityIndex
+from weather_service import AsyncWeatherService
+
+
+def weather_payload(name: str) -> dict:
+    return {
+        "id": 3390760,
+        "name": name,
+        "sys": {"country": "BR"},
+        "main": {"temp": 28.5, "feels_like": 31.0, "humidity": 70},
+        "wind": {"speed": 4.1},
+        "weather": [{"description": "algumas nuvens", "icon": "02d"}],
+    }
+
+
+def test_stale_batch_entry_is_refreshed_once_in_background(monkeypatch):
+    monkeypatch.setenv("OPENWEATHER_API_KEY", "teste")
+    calls = []
+
+    async def upstream(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json=weather_payload(request.url.params["q"]))
+
+    async def scenario():
+        service = AsyncWeatherService(
+            cache=MemoryCache(), client=httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+        )
+        key = service._key("weather", "Recife", "metric", "pt_br")
+        await service.cache.set(key, {"city": "Recife", "temperature": 20.0}, ttl=0, stale_ttl=60)
+
+        batches = await asyncio.gather(*(service.get_weather_batch(["Recife", "recife"]) for _ in range(3)))
+        # O valor vencido é servido na hora; a revalidação fica em segundo plano
+        assert all(result["temperature"] == 20.0 for batch in batches for result in batch)
+        await asyncio.gather(*service._refresh_tasks.values())
+
+        assert len(calls) == 1
+        state, value = await service.cache.get(key)
+        assert state == FRESH and value["temperature"] == 28.5
+        await service.close()
+
+    asyncio.run(scenario())
+
+
+def test_snapshot_entries_are_rekeyed_like_the_cache(monkeypatch, tmp_path):
+    monkeypatch.setenv("OPENWEATHER_API_KEY", "teste")
+    calls = []
+
+    async def upstream(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url)
+        return httpx.Response(200, json=weather_payload("São Paulo"))
+
+    def make_service(city_index=None) -> AsyncWeatherService:
+        return AsyncWeatherService(
+            cache=MemoryCache(), city_index=city_index,
+            client=httpx.AsyncClient(transport=httpx.MockTransport(upstream)),
+        )
+
+    async def scenario():
+        path = str(tmp_path / "cache_snapshot.json")
+        # Gravado sem o índice local: uma entrada por grafia
+        before = make_service()
+        await before.get_weather("sao paulo")
+        await before.get_weather("São Paulo")
+        await before.save_snapshot(path)
+        await before.close()
+        assert len(calls) == 2
+
+        after = make_service(CityIndex([{"id": 3448439, "name": "São Paulo", "country": "BR"}]))
+        assert await after.load_snapshot(path) == 1
+        for city in ("sao paulo", "SÃO PAULO"):
+            assert (await after.get_weather(city))["city"] == "São Paulo"
+        assert len(calls) == 2
+        await after.close()
+
+    asyncio.run(scenario())
+
+
+def test_quota_split_keeps_the_prefetch_budget_independent_of_workers(monkeypatch):
+    monkeypatch.setattr(config, "OPENWEATHER_CALLS_PER_MINUTE", 60)
+    monkeypatch.setattr(config, "OPENWEATHER_CALLS_PER_DAY", 0)
+    monkeypatch.setattr(config, "BACKGROUND_LOCK_PATH", "background.lock")
+    monkeypatch.setattr(config, "PREFETCH_QUOTA_SHARE", 0.2)
+    for workers in (2, 4, 100):
+        monkeypatch.setattr(config, "WORKERS", workers)
+        service = AsyncWeatherService(cache=MemoryCache())
+        service.reserve_prefetch_quota()
+        per_worker = service.limiter._buckets["minute"].rate * 60
+        prefetch = service.prefetch_limiter._buckets["minute"].rate * 60
+        assert prefetch == pytest.approx(12)
+        # Nenhum piso por worker: a soma das partes com a da pré-busca é a cota
+        assert per_worker * workers + prefetch == pytest.approx(60)
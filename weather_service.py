@@ -1,81 +1,537 @@
-import requests
+import asyncio
+import logging
+import random
+import httpx
 import os
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional
 from dotenv import load_dotenv
 
+import config
+from cache import FRESH, MISS, STALE, TTLCache, make_key, normalize_city
+from cache_backend import CacheBackend, create_cache_backend
+from circuit import CircuitBreaker, CircuitOpen, UpstreamUnavailable
+from gazetteer import CityIndex
+from metrics import STAGE_LATENCY, UPSTREAM_RESPONSES
+from ratelimit import COMPARE, INTERACTIVE, PREFETCH, RateLimiter, RateLimitExceeded
+from singleflight import SingleFlight
+from snapshot import read_snapshot, write_snapshot
+
 load_dotenv()
 
-class WeatherService:
-    def __init__(self):
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Máximo de IDs aceitos pelo endpoint /group do OpenWeatherMap
+GROUP_CHUNK_SIZE = 20
+
+
+def _prefetch_share() -> float:
+    """Fração das cotas reservada à pré-busca: só com vários workers e a trava que elege quem a roda"""
+    return config.PREFETCH_QUOTA_SHARE if config.WORKERS > 1 and config.BACKGROUND_LOCK_PATH else 0.0
+
+
+def _worker_quota(limit: float) -> float:
+    """Parte deste worker na cota do OpenWeatherMap (a cota configurada vale para o servidor todo).
+
+    A fração reservada à pré-busca sai da cota antes da divisão: a soma das
+    partes dos workers com a da pré-busca não passa da cota configurada.
+    """
+    return limit * (1 - _prefetch_share()) / config.WORKERS
+
+
+def parse_weather(data: Dict) -> Dict:
+    """Normaliza a resposta de /weather do OpenWeatherMap"""
+    return {
+        "city": data["name"],
+        "country": data["sys"]["country"],
+        "temperature": round(data["main"]["temp"], 1),
+        "feels_like": round(data["main"]["feels_like"], 1),
+        "humidity": data["main"]["humidity"],
+        "wind_speed": round(data["wind"]["speed"], 1),
+        "description": data["weather"][0]["description"].title(),
+        "icon": data["weather"][0]["icon"]
+    }
+
+
+FORECAST_FIELDS = ("datetime", "temperature", "feels_like", "humidity", "wind_speed", "description", "icon")
+
+
+def parse_forecast_columns(data: Dict) -> Dict:
+    """Normaliza a resposta de /forecast do OpenWeatherMap em colunas paralelas.
+
+    Uma lista por campo, sem um dict por previsão; é a forma guardada no cache.
+    """
+    items = data["list"][:40]  # 5 dias, 8 previsões por dia
+    mains = [item["main"] for item in items]
+    conditions = [item["weather"][0] for item in items]
+    return {
+        "city": data["city"]["name"],
+        "country": data["city"]["country"],
+        "forecasts": {
+            "datetime": [item["dt_txt"] for item in items],
+            "temperature": [round(main["temp"], 1) for main in mains],
+            "feels_like": [round(main["feels_like"], 1) for main in mains],
+            "humidity": [main["humidity"] for main in mains],
+            "wind_speed": [round(item["wind"]["speed"], 1) for item in items],
+            "description": [condition["description"].title() for condition in conditions],
+            "icon": [condition["icon"] for condition in conditions],
+        },
+    }
+
+
+def forecast_rows(forecast: Dict) -> Dict:
+    """Converte a previsão em colunas para uma lista de previsões (formato de ForecastResponse)"""
+    columns = forecast["forecasts"]
+    return {
+        "city": forecast["city"],
+        "country": forecast["country"],
+        "forecasts": [
+            dict(zip(FORECAST_FIELDS, values)) for values in zip(*(columns[field] for field in FORECAST_FIELDS))
+        ],
+    }
+
+
+class CityNotFound(ValueError):
+    """Cidade desconhecida, localmente ou pelo OpenWeatherMap"""
+
+
+def _check_status(status_code: int, city: str, error_message: str):
+    if status_code == 404:
+        raise CityNotFound(f"Cidade '{city}' não encontrada")
+    elif status_code == 429:
+        raise RateLimitExceeded("OpenWeatherMap recusou a chamada por limite de uso. Tente novamente em instantes")
+    elif status_code >= 500:
+        raise UpstreamUnavailable(error_message)
+    elif status_code != 200:
+        raise ValueError(error_message)
+
+
+class AsyncWeatherService:
+    """Cliente do OpenWeatherMap sobre um cliente HTTP assíncrono com pool keep-alive.
+
+    O cliente é criado em `start()` (ou no primeiro uso) e deve ser fechado com
+    `close()` no encerramento da aplicação.
+    """
+
+    def __init__(self, cache: Optional[CacheBackend] = None, client: Optional[httpx.AsyncClient] = None,
+                 limiter: Optional[RateLimiter] = None, city_index: Optional[CityIndex] = None,
+                 on_forecast: Optional[Callable[[str, str, Dict], None]] = None):
         self.api_key = os.getenv("OPENWEATHER_API_KEY")
-        self.base_url = "http://api.openweathermap.org/data/2.5/weather"
-        self.forecast_url = "http://api.openweathermap.org/data/2.5/forecast"
-    
-    def get_weather(self, city: str, units: str = "metric", lang: str = "pt_br") -> Dict:
+        self.base_url = f"{config.OPENWEATHER_BASE_URL}/weather"
+        self.forecast_url = f"{config.OPENWEATHER_BASE_URL}/forecast"
+        self.group_url = f"{config.OPENWEATHER_BASE_URL}/group"
+        self.cache = cache if cache is not None else create_cache_backend()
+        self.city_index = city_index
+        # Chamado com (cidade, unidades, previsão em colunas) a cada previsão obtida do OpenWeatherMap
+        self.on_forecast = on_forecast
+        # Respostas 404 lembradas por pouco tempo para não repetir a chamada
+        self.negative_cache = TTLCache(config.NEGATIVE_CACHE_MAX_ENTRIES)
+        self.breaker = CircuitBreaker(config.CIRCUIT_FAILURE_THRESHOLD, config.CIRCUIT_RESET_TIMEOUT)
+        # Nome normalizado -> ID do OpenWeatherMap, aprendido das respostas (só para lotes do /group)
+        self.city_ids: Dict[str, int] = {}
+        self.limiter = limiter if limiter is not None else RateLimiter(
+            _worker_quota(config.OPENWEATHER_CALLS_PER_MINUTE), _worker_quota(config.OPENWEATHER_CALLS_PER_DAY)
+        )
+        if limiter is None and 0 < _worker_quota(config.OPENWEATHER_CALLS_PER_MINUTE) < 1:
+            logger.warning(
+                "Cota de %g chamadas/min dividida entre %d workers: menos de uma por minuto para cada um. "
+                "Reduza WEB_CONCURRENCY", config.OPENWEATHER_CALLS_PER_MINUTE, config.WORKERS,
+            )
+        # Cota própria da pré-busca, ativada no worker que detém a trava de segundo plano
+        self.prefetch_limiter: Optional[RateLimiter] = None
+        self._client = client
+        # Chave -> revalidação em segundo plano em andamento neste processo
+        self._refresh_tasks: Dict[str, asyncio.Task] = {}
+        self.flight = SingleFlight()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(config.UPSTREAM_TIMEOUT, connect=config.UPSTREAM_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=config.UPSTREAM_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.UPSTREAM_MAX_KEEPALIVE,
+                ),
+            )
+        return self._client
+
+    async def start(self):
+        self.client
+
+    async def close(self):
+        for task in list(self._refresh_tasks.values()):
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        await self.cache.close()
+
+    async def save_snapshot(self, path: str) -> int:
+        """Persiste o cache e os IDs de cidade resolvidos; devolve o número de entradas gravadas"""
+        entries = await self.cache.snapshot()
+        return await asyncio.to_thread(
+            write_snapshot, path, entries, dict(self.city_ids), config.CACHE_LAST_KNOWN_TTL
+        )
+
+    async def load_snapshot(self, path: str) -> int:
+        """Aquece o cache com um snapshot gravado por `save_snapshot`; devolve o número de entradas lidas.
+
+        As chaves são recalculadas com `_key()`: entradas gravadas sem o índice
+        local de cidades (ou com outro) ficam sob a mesma chave que o cache
+        consulta agora, e grafias da mesma cidade voltam a ser uma entrada só.
+        """
+        data = await asyncio.to_thread(read_snapshot, path)
+        by_key: Dict[str, tuple] = {}
+        for entry in data["entries"]:
+            key = self._snapshot_key(entry[0])
+            if key is None:
+                continue
+            existing = by_key.get(key)
+            if existing is None or entry[2] >= existing[2]:
+                by_key[key] = (key, *entry[1:])
+        entries = list(by_key.values())
+        await self.cache.restore(entries)
+        for city, city_id in data["city_ids"].items():
+            if len(self.city_ids) >= config.CACHE_MAX_ENTRIES:
+                break
+            self.city_ids.setdefault(city, city_id)
+        return len(entries)
+
+    def reserve_prefetch_quota(self):
+        """Passa a atender chamadas de pré-busca pela fração reservada das cotas (PREFETCH_QUOTA_SHARE).
+
+        Chamado pelo worker que detém a trava de segundo plano: o orçamento da
+        pré-busca não diminui com o número de workers.
+        """
+        share = _prefetch_share()
+        if share and self.prefetch_limiter is None:
+            self.prefetch_limiter = RateLimiter(
+                config.OPENWEATHER_CALLS_PER_MINUTE * share, config.OPENWEATHER_CALLS_PER_DAY * share
+            )
+
+    def _snapshot_key(self, key: str) -> Optional[str]:
+        """Chave de cache atual de uma entrada do snapshot; None se a cidade não existe mais no índice"""
+        try:
+            endpoint, units, lang, city = key.split(":", 3)
+        except ValueError:
+            return key
+        if city.startswith("#"):
+            return key
+        try:
+            return self._key(endpoint, city, units, lang)
+        except CityNotFound:
+            return None
+
+    async def get_weather(self, city: str, units: str = "metric", lang: str = "pt_br",
+                          priority: int = INTERACTIVE) -> Dict:
         if not self.api_key:
             raise ValueError("API key não configurada")
-        
-        params = {
-            "q": city,
+
+        return await self._cached(
+            "weather", city, units, lang, config.WEATHER_CACHE_TTL, self._fetch_weather, priority
+        )
+
+    async def get_forecast(self, city: str, units: str = "metric", lang: str = "pt_br",
+                           priority: int = INTERACTIVE, columnar: bool = False) -> Dict:
+        """Previsão de 5 dias; com `columnar` devolve as colunas do cache sem montar um dict por previsão"""
+        if not self.api_key:
+            raise ValueError("API key não configurada")
+
+        forecast = await self._cached(
+            "forecast", city, units, lang, config.FORECAST_CACHE_TTL, self._fetch_forecast, priority
+        )
+        return forecast if columnar else forecast_rows(forecast)
+
+    async def refresh_weather(self, city: str, units: str = "metric", lang: str = "pt_br",
+                              ttl: Optional[float] = None, priority: int = PREFETCH) -> Dict:
+        """Consulta o OpenWeatherMap ignorando o cache e atualiza a entrada"""
+        if not self.api_key:
+            raise ValueError("API key não configurada")
+
+        key = self._key("weather", city, units, lang)
+        ttl = ttl or config.WEATHER_CACHE_TTL
+        return await self.flight.do(
+            key, lambda: self._load(key, self._fetch_weather, city, units, lang, ttl, priority)
+        )
+
+    async def refresh_forecast(self, city: str, units: str = "metric", lang: str = "pt_br",
+                               ttl: Optional[float] = None, priority: int = PREFETCH) -> Dict:
+        if not self.api_key:
+            raise ValueError("API key não configurada")
+
+        key = self._key("forecast", city, units, lang)
+        ttl = ttl or config.FORECAST_CACHE_TTL
+        return await self.flight.do(
+            key, lambda: self._load(key, self._fetch_forecast, city, units, lang, ttl, priority)
+        )
+
+    async def get_weather_batch(self, cities: List[str], units: str = "metric", lang: str = "pt_br",
+                                priority: int = COMPARE, timeout: Optional[float] = None) -> List[Dict]:
+        """Clima atual de várias cidades com o mínimo de chamadas ao OpenWeatherMap.
+
+        Cidades em cache são servidas direto; as com ID conhecido são buscadas
+        pelo endpoint /group em lotes de 20 e as demais individualmente, em
+        paralelo. Falhas voltam como {"city", "error"} na posição da cidade.
+        """
+        if not self.api_key:
+            raise ValueError("API key não configurada")
+
+        deadline = asyncio.get_running_loop().time() + (timeout or config.COMPARE_CITY_TIMEOUT)
+        results: Dict[int, Dict] = {}
+        by_id: Dict[int, List[int]] = {}
+        unresolved: List[int] = []
+        city_ids: Dict[int, Optional[int]] = {}
+        for index, city in enumerate(cities):
+            try:
+                city_ids[index] = self._resolve(city)
+            except ValueError:
+                results[index] = {"city": city, "error": "Cidade não encontrada"}
+
+        # Uma única consulta ao cache para todas as cidades
+        keys = [self._key("weather", cities[index], units, lang) for index in city_ids]
+        lookups = await self.cache.get_many(keys)
+        for (index, city_id), key, (state, value) in zip(city_ids.items(), keys, lookups):
+            if city_id is None:
+                # ID aprendido de respostas anteriores: só serve para montar os lotes do /group
+                city_id = self.city_ids.get(normalize_city(cities[index]))
+            if state == STALE:
+                # Como em get_weather: serve o valor vencido e revalida em segundo plano
+                self._schedule_refresh(key, self._fetch_weather, cities[index], units, lang,
+                                       config.WEATHER_CACHE_TTL)
+            if state != MISS:
+                results[index] = value
+            elif city_id is not None:
+                by_id.setdefault(city_id, []).append(index)
+            else:
+                unresolved.append(index)
+
+        ids = list(by_id)
+        chunks = [ids[start:start + GROUP_CHUNK_SIZE] for start in range(0, len(ids), GROUP_CHUNK_SIZE)]
+        outcomes = await asyncio.gather(
+            *(self._with_deadline(self._fetch_group(chunk, units, lang, priority), deadline) for chunk in chunks),
+            return_exceptions=True,
+        )
+        fetched = []
+        for chunk, outcome in zip(chunks, outcomes):
+            found = {} if isinstance(outcome, BaseException) else outcome
+            for city_id in chunk:
+                if city_id not in found:
+                    # Lote falhou ou ID não retornado: tenta a cidade individualmente
+                    unresolved.extend(by_id[city_id])
+                    continue
+                for index in by_id[city_id]:
+                    results[index] = found[city_id]
+                    fetched.append((self._key("weather", cities[index], units, lang), found[city_id]))
+        await self.cache.set_many(fetched, config.WEATHER_CACHE_TTL, config.CACHE_STALE_TTL)
+
+        semaphore = asyncio.Semaphore(config.COMPARE_CONCURRENCY)
+
+        async def fetch_city(city: str) -> Dict:
+            async with semaphore:
+                return await self.get_weather(city, units, lang, priority)
+
+        singles = await asyncio.gather(
+            *(self._weather_or_error(cities[index], fetch_city(cities[index]), deadline) for index in unresolved)
+        )
+        results.update(zip(unresolved, singles))
+        return [results[index] for index in range(len(cities))]
+
+    async def _with_deadline(self, awaitable, deadline: float):
+        return await asyncio.wait_for(awaitable, max(0.0, deadline - asyncio.get_running_loop().time()))
+
+    async def _weather_or_error(self, city: str, awaitable, deadline: float) -> Dict:
+        try:
+            return await self._with_deadline(awaitable, deadline)
+        except asyncio.TimeoutError:
+            return {"city": city, "error": "Tempo esgotado"}
+        except RateLimitExceeded:
+            return {"city": city, "error": "Limite de chamadas atingido"}
+        except UpstreamUnavailable:
+            return {"city": city, "error": "Serviço de clima indisponível"}
+        except Exception:
+            return {"city": city, "error": "Cidade não encontrada"}
+
+    async def _cached(self, endpoint: str, city: str, units: str, lang: str, ttl: float, fetch: Callable,
+                      priority: int) -> Dict:
+        key = self._key(endpoint, city, units, lang)
+        state, error = self.negative_cache.get(key)
+        if state == FRESH:
+            raise CityNotFound(error)
+        state, value = await self.cache.get(key)
+        if state == FRESH:
+            return value
+        if state == STALE:
+            self._schedule_refresh(key, fetch, city, units, lang, ttl)
+            return value
+
+        try:
+            return await self.flight.do(key, lambda: self._load(key, fetch, city, units, lang, ttl, priority))
+        except UpstreamUnavailable:
+            # Com o OpenWeatherMap fora, serve o último valor conhecido, mesmo vencido
+            last_known = await self.cache.peek(key)
+            if last_known is None:
+                raise
+            return last_known
+
+    async def _load(self, key: str, fetch: Callable, city: str, units: str, lang: str, ttl: float,
+                    priority: int) -> Dict:
+        token = await self.cache.acquire_lock(key, config.CACHE_LOCK_TTL)
+        if token is None:
+            # Outro worker já está buscando esta chave: aproveita o resultado dele
+            await self.cache.wait_unlocked(key, config.CACHE_LOCK_TTL)
+            state, value = await self.cache.get(key)
+            if state == FRESH:
+                return value
+        try:
+            value = await fetch(city, units, lang, priority)
+            await self.cache.set(key, value, ttl, config.CACHE_STALE_TTL)
+        except CityNotFound as e:
+            self.negative_cache.set(key, str(e), config.NEGATIVE_CACHE_TTL)
+            raise
+        finally:
+            if token is not None:
+                await self.cache.release_lock(key, token)
+        return value
+
+    def _schedule_refresh(self, key: str, fetch: Callable, city: str, units: str, lang: str, ttl: float):
+        """Revalida uma entrada vencida em segundo plano, uma vez por chave neste processo"""
+        if key not in self._refresh_tasks:
+            task = asyncio.create_task(self._refresh(key, fetch, city, units, lang, ttl))
+            self._refresh_tasks[key] = task
+            task.add_done_callback(lambda _: self._refresh_tasks.pop(key, None))
+
+    async def _refresh(self, key: str, fetch: Callable, city: str, units: str, lang: str, ttl: float):
+        # Quem pediu já recebeu o valor em cache: a revalidação entra na fila de menor prioridade
+        try:
+            await self.flight.do(key, lambda: self._load(key, fetch, city, units, lang, ttl, PREFETCH))
+        except Exception:
+            logger.warning("Falha ao revalidar cache para %s", key, exc_info=True)
+
+    async def _request(self, url: str, params: Dict, priority: int = INTERACTIVE) -> httpx.Response:
+        """GET pelo disjuntor: falha imediatamente enquanto o OpenWeatherMap estiver instável"""
+        if not self.breaker.allow():
+            raise CircuitOpen("Serviço de clima indisponível no momento. Tente novamente em instantes")
+        recorded = False
+        try:
+            response = await self._request_with_retry(url, params, priority)
+        except httpx.TransportError:
+            self.breaker.record_failure()
+            recorded = True
+            raise UpstreamUnavailable("Serviço de clima não respondeu")
+        finally:
+            if not recorded:
+                # Limitador, cancelamento ou resposta: libera a chamada de teste do disjuntor
+                self.breaker.release()
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    async def _request_with_retry(self, url: str, params: Dict, priority: int) -> httpx.Response:
+        """GET com retry e backoff exponencial para falhas de rede, 429 e 5xx.
+
+        Cada tentativa consome uma ficha do limitador compartilhado.
+        """
+        max_wait = config.RATE_LIMIT_PREFETCH_MAX_WAIT if priority == PREFETCH else config.RATE_LIMIT_MAX_WAIT
+        limiter = self.limiter
+        if priority == PREFETCH and self.prefetch_limiter is not None:
+            limiter = self.prefetch_limiter
+        endpoint = url.rsplit("/", 1)[-1]
+        for attempt in range(config.UPSTREAM_RETRIES + 1):
+            last_attempt = attempt == config.UPSTREAM_RETRIES
+            await limiter.acquire(priority, max_wait)
+            try:
+                with STAGE_LATENCY.time("upstream"):
+                    response = await self.client.get(url, params=params)
+            except httpx.TransportError:
+                UPSTREAM_RESPONSES.inc(endpoint, "error")
+                if last_attempt:
+                    raise
+            else:
+                UPSTREAM_RESPONSES.inc(endpoint, str(response.status_code))
+                if response.status_code not in RETRY_STATUS or last_attempt:
+                    return response
+            delay = config.UPSTREAM_BACKOFF * (2 ** attempt)
+            await asyncio.sleep(delay + random.uniform(0, delay))
+
+    def _resolve(self, city: str) -> Optional[int]:
+        """ID do OpenWeatherMap da cidade pelo índice local, quando identificável sem ambiguidade.
+
+        Com o índice local carregado, cidades inexistentes são rejeitadas aqui,
+        sem chamada ao OpenWeatherMap. Não consulta os IDs aprendidos das
+        respostas (`city_ids`): a chave de cache de uma cidade não pode mudar
+        depois da primeira busca, nem diferir entre workers.
+        """
+        if self.city_index is not None:
+            # Nomes rejeitados há pouco não repetem a busca por sugestões (varredura de trigramas)
+            rejected_key = f"unknown:{normalize_city(city)}"
+            state, error = self.negative_cache.get(rejected_key)
+            if state == FRESH:
+                raise CityNotFound(error)
+            matches = self.city_index.lookup(city)
+            if not matches:
+                message = f"Cidade '{city}' não encontrada"
+                suggestions = self.city_index.suggest(city, limit=3)
+                if suggestions:
+                    message += ". Você quis dizer: " + "; ".join(
+                        f"{item['name']}, {item['country']}" for item in suggestions
+                    ) + "?"
+                self.negative_cache.set(rejected_key, message, config.NEGATIVE_CACHE_TTL)
+                raise CityNotFound(message)
+            if len(matches) == 1:
+                return matches[0]["id"]
+        return None
+
+    def _key(self, endpoint: str, city: str, units: str, lang: str) -> str:
+        # Variações de grafia da mesma cidade compartilham a entrada de cache
+        city_id = self._resolve(city)
+        return make_key(endpoint, f"#{city_id}" if city_id is not None else city, units, lang)
+
+    def _params(self, city: str, units: str, lang: str) -> Dict:
+        city_id = self._resolve(city)
+        return {
+            **({"id": city_id} if city_id is not None else {"q": city}),
             "appid": self.api_key,
             "units": units,
             "lang": lang
         }
-        
-        response = requests.get(self.base_url, params=params)
-        
-        if response.status_code == 404:
-            raise ValueError(f"Cidade '{city}' não encontrada")
-        elif response.status_code != 200:
-            raise ValueError("Erro ao consultar API do clima")
-        
-        data = response.json()
-        
-        return {
-            "city": data["name"],
-            "country": data["sys"]["country"],
-            "temperature": round(data["main"]["temp"], 1),
-            "feels_like": round(data["main"]["feels_like"], 1),
-            "humidity": data["main"]["humidity"],
-            "wind_speed": round(data["wind"]["speed"], 1),
-            "description": data["weather"][0]["description"].title(),
-            "icon": data["weather"][0]["icon"]
-        }
-    
-    def get_forecast(self, city: str, units: str = "metric", lang: str = "pt_br") -> Dict:
-        if not self.api_key:
-            raise ValueError("API key não configurada")
-        
+
+    async def _fetch_weather(self, city: str, units: str, lang: str, priority: int = INTERACTIVE) -> Dict:
+        response = await self._request(self.base_url, self._params(city, units, lang), priority)
+        _check_status(response.status_code, city, "Erro ao consultar API do clima")
+        with STAGE_LATENCY.time("normalization"):
+            data = response.json()
+            self._remember_id(city, data)
+            return parse_weather(data)
+
+    async def _fetch_group(self, city_ids: List[int], units: str, lang: str, priority: int) -> Dict[int, Dict]:
+        """Clima atual de até 20 cidades por ID em uma única chamada"""
         params = {
-            "q": city,
+            "id": ",".join(str(city_id) for city_id in city_ids),
             "appid": self.api_key,
             "units": units,
             "lang": lang
         }
-        
-        response = requests.get(self.forecast_url, params=params)
-        
-        if response.status_code == 404:
-            raise ValueError(f"Cidade '{city}' não encontrada")
-        elif response.status_code != 200:
-            raise ValueError("Erro ao consultar previsão do tempo")
-        
-        data = response.json()
-        
-        forecasts = []
-        for item in data["list"][:40]:  # 5 dias, 8 previsões por dia
-            forecasts.append({
-                "datetime": item["dt_txt"],
-                "temperature": round(item["main"]["temp"], 1),
-                "feels_like": round(item["main"]["feels_like"], 1),
-                "humidity": item["main"]["humidity"],
-                "wind_speed": round(item["wind"]["speed"], 1),
-                "description": item["weather"][0]["description"].title(),
-                "icon": item["weather"][0]["icon"]
-            })
-        
-        return {
-            "city": data["city"]["name"],
-            "country": data["city"]["country"],
-            "forecasts": forecasts
-        }
\ No newline at end of file
+        response = await self._request(self.group_url, params, priority)
+        _check_status(response.status_code, params["id"], "Erro ao consultar API do clima")
+        with STAGE_LATENCY.time("normalization"):
+            return {item["id"]: parse_weather(item) for item in response.json()["list"]}
+
+    def _remember_id(self, city: str, data: Dict):
+        if "id" in data and len(self.city_ids) < config.CACHE_MAX_ENTRIES:
+            self.city_ids[normalize_city(city)] = data["id"]
+
+    async def _fetch_forecast(self, city: str, units: str, lang: str, priority: int = INTERACTIVE) -> Dict:
+        response = await self._request(self.forecast_url, self._params(city, units, lang), priority)
+        _check_status(response.status_code, city, "Erro ao consultar previsão do tempo")
+        with STAGE_LATENCY.time("normalization"):
+            forecast = parse_forecast_columns(response.json())
+        if self.on_forecast is not None:
+            try:
+                self.on_forecast(city, units, forecast)
+            except Exception:
+                logger.warning("Falha ao registrar previsão de '%s'", city, exc_info=True)
+        return forecast